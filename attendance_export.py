@@ -0,0 +1,122 @@
+import csv
+import io
+import os
+import tempfile
+
+from functools import lru_cache
+
+from db_pool import pooled_connection
+
+CHECKED_IN = '已签到'
+LEAVE = '请假'
+ABSENT = '缺勤'
+
+
+def load_tasks(start=None, end=None):
+    # 按任务过期时间筛选学期内的签到任务
+    where, params = [], []
+    if start:
+        where.append("expireTime >= %s")
+        params.append(start)
+    if end:
+        where.append("expireTime < %s")
+        params.append(end)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT taskId, taskName, expireTime FROM checkin_task"
+                       + (" WHERE " + " AND ".join(where) if where else "")
+                       + " ORDER BY taskId", tuple(params))
+        return cursor.fetchall()
+
+
+def status(note):
+    if note and note.startswith('由') and note.endswith('请假'):
+        return LEAVE
+    return CHECKED_IN
+
+
+def rows(tasks, role=None):
+    # 一次流式查询（未缓冲游标），按学号排序后逐个学生产出 [学号, 姓名, 各任务状态...]
+    index = {task[0]: i for i, task in enumerate(tasks)}
+    params = []
+    if tasks:
+        query = "SELECT u.uid, u.name, r.taskId, r.note FROM user u"
+    else:
+        query = "SELECT u.uid, u.name, NULL, NULL FROM user u"
+    if role:
+        query += " JOIN user_role ur ON ur.uid = u.uid AND ur.role = %s"
+        params.append(role)
+    if tasks:
+        placeholders = ", ".join(["%s"] * len(tasks))
+        query += f" LEFT JOIN checkin_record r ON r.uid = u.uid AND r.taskId IN ({placeholders})"
+        params.extend(index)
+    query += " ORDER BY u.uid"
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, tuple(params))
+        current = None
+        for uid, name, task_id, note in cursor:
+            if current is None or current[0] != uid:
+                if current is not None:
+                    yield current
+                current = [uid, name] + [ABSENT] * len(tasks)
+            if task_id is not None:
+                current[2 + index[task_id]] = status(note)
+        if current is not None:
+            yield current
+
+
+def header(tasks):
+    return ['学号', '姓名'] + [f"{task[1]}({task[0]})" for task in tasks]
+
+
+def generate_csv(tasks, role=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 带 BOM，Excel 打开时按 UTF-8 识别中文
+    buffer.write('\ufeff')
+    writer.writerow(header(tasks))
+    for row in rows(tasks, role):
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    data = buffer.getvalue()
+    if data:
+        yield data.encode('utf-8')
+
+
+@lru_cache(maxsize=1)
+def xlsx_available():
+    # openpyxl 为可选依赖，首次导出 xlsx 时再导入
+    try:
+        import openpyxl
+    except ImportError:
+        return False
+    return True
+
+
+def write_xlsx(tasks, role=None):
+    # openpyxl 只写模式逐行写入临时文件，返回文件路径，由调用方发送后删除
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('考勤')
+    sheet.append(header(tasks))
+    for row in rows(tasks, role):
+        sheet.append(row)
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    workbook.save(path)
+    return path
+
+
+def stream_file(path, chunk_size=64 * 1024):
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
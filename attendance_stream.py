@@ -0,0 +1,138 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from db_pool import connection
+
+UNCHECKED_QUERY = """
+    SELECT uid, name FROM user WHERE uid NOT IN (
+      SELECT uid FROM checkin_record WHERE taskId=%s
+    )
+  """
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class _TaskState:
+
+    def __init__(self, remaining):
+        self.remaining = remaining
+        self.subscribers = []
+        self.loaded_at = time.monotonic()
+
+
+class AttendanceHub:
+    # 每个任务只在首次订阅时查询一次未签到名单，之后由签到/请假接口推送变化。
+    # 最后一个订阅者断开后释放该任务的状态
+
+    def __init__(self, heartbeat=None, resync=None):
+        self.heartbeat = heartbeat or float(os.getenv("sse.heartbeat", 15))
+        # 多进程部署时其他 worker 的签到不会推送到本进程，定期与数据库对账
+        self.resync = resync or float(os.getenv("sse.resync", 60))
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def _load(self, task_id):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(UNCHECKED_QUERY, (task_id,))
+            return dict(cursor.fetchall())
+
+    def task_exists(self, task_id):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT taskId FROM checkin_task WHERE taskId=%s", (task_id,))
+            return cursor.fetchone() is not None
+
+    def _publish(self, state, event, data):
+        for q in state.subscribers:
+            q.put((event, data))
+
+    def mark(self, task_id, uid, kind):
+        # 签到/请假成功后调用；没有人订阅该任务时什么也不做
+        with self._lock:
+            state = self._tasks.get(str(task_id))
+            if state is None:
+                return
+            if str(uid) not in state.remaining:
+                # 已不在名单中（重复推送或对账已处理）
+                return
+            name = state.remaining.pop(str(uid))
+            self._publish(state, 'update', {'uid': str(uid), 'name': name, 'kind': kind,
+                                            'remaining': len(state.remaining)})
+
+    def _kinds(self, task_id, uids):
+        # 请假记录没有坐标（见 main.api_checkin_leave）
+        placeholders = ", ".join(["%s"] * len(uids))
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT uid, longitude IS NULL FROM checkin_record "
+                           f"WHERE taskId=%s AND uid IN ({placeholders})", (task_id, *uids))
+            return {uid: 'leave' if is_leave else 'checkin' for uid, is_leave in cursor.fetchall()}
+
+    def _resync(self, task_id, state):
+        with self._lock:
+            # 同一任务的多个订阅者共用一次对账
+            state.loaded_at = time.monotonic()
+        remaining = self._load(task_id)
+        with self._lock:
+            gone = [u for u in state.remaining if u not in remaining]
+        kinds = self._kinds(task_id, gone) if gone else {}
+        with self._lock:
+            if self._tasks.get(task_id) is not state:
+                return
+            for uid in gone:
+                if uid not in state.remaining:
+                    # 对账期间已由 mark 推送
+                    continue
+                name = state.remaining.pop(uid)
+                self._publish(state, 'update', {'uid': uid, 'name': name, 'kind': kinds.get(uid, 'checkin'),
+                                                'remaining': len(state.remaining)})
+
+    def _subscribe(self, task_id):
+        q = queue.Queue()
+        with self._lock:
+            loaded = task_id in self._tasks
+        remaining = None if loaded else self._load(task_id)
+        with self._lock:
+            state = self._tasks.get(task_id)
+            if state is None:
+                # 期间最后一个订阅者可能已断开并释放了状态，此时重新加载
+                if remaining is None:
+                    remaining = self._load(task_id)
+                state = self._tasks[task_id] = _TaskState(remaining)
+            state.subscribers.append(q)
+            snapshot = [{'uid': uid, 'name': name} for uid, name in state.remaining.items()]
+        return state, q, snapshot
+
+    def _unsubscribe(self, task_id, state, q):
+        with self._lock:
+            if q in state.subscribers:
+                state.subscribers.remove(q)
+            if not state.subscribers and self._tasks.get(task_id) is state:
+                del self._tasks[task_id]
+
+    def stream(self, task_id):
+        task_id = str(task_id)
+        state, q, snapshot = self._subscribe(task_id)
+        try:
+            yield _sse('snapshot', {'items': snapshot, 'remaining': len(snapshot)})
+            while True:
+                # 每轮都检查：签到高峰时本进程的推送不断，不能只在心跳超时时对账
+                if time.monotonic() - state.loaded_at >= self.resync:
+                    self._resync(task_id, state)
+                try:
+                    event, data = q.get(timeout=min(self.heartbeat, self.resync))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, data)
+        finally:
+            self._unsubscribe(task_id, state, q)
+
+
+hub = AttendanceHub()
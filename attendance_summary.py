@@ -0,0 +1,151 @@
+import argparse
+import datetime
+import sys
+
+from dotenv import load_dotenv
+
+import db_pool
+
+# 约定：checkedIn/onLeave 在签到、请假时即时累加；eligible/absent 在任务过期时一次性结算，
+# 结算之后才补的签到、请假再把 absent 减回去
+LEAVE_NOTE = "r.note LIKE '由%请假'"
+
+UPSERT_CHECKIN = ("INSERT INTO attendance_summary(uid, checkedIn, lastCheckin) VALUES(%s, 1, %s) "
+                  "ON DUPLICATE KEY UPDATE checkedIn=checkedIn+1, "
+                  "lastCheckin=GREATEST(COALESCE(lastCheckin, VALUES(lastCheckin)), VALUES(lastCheckin))")
+UPSERT_LEAVE = ("INSERT INTO attendance_summary(uid, onLeave) VALUES(%s, 1) "
+                "ON DUPLICATE KEY UPDATE onLeave=onLeave+1")
+SETTLED_ABSENT = ("UPDATE attendance_summary s JOIN checkin_task t ON t.taskId=%s AND t.summarized=1 "
+                  "SET s.absent=s.absent-1 WHERE s.uid=%s AND s.absent > 0")
+
+SUMMARY_COLUMNS = ('uid', 'eligible', 'checkedIn', 'onLeave', 'absent', 'lastCheckin')
+
+# 从 checkin_record/checkin_task 全量计算，与增量维护的口径一致
+REBUILD_SELECT = f"""
+    SELECT u.uid,
+           (SELECT COUNT(*) FROM checkin_task t WHERE t.summarized=1) AS eligible,
+           COUNT(CASE WHEN r.recordId IS NOT NULL AND NOT ({LEAVE_NOTE}) THEN 1 END) AS checkedIn,
+           COUNT(CASE WHEN {LEAVE_NOTE} THEN 1 END) AS onLeave,
+           (SELECT COUNT(*) FROM checkin_task t WHERE t.summarized=1 AND NOT EXISTS (
+              SELECT 1 FROM checkin_record r2 WHERE r2.taskId=t.taskId AND r2.uid=u.uid)) AS absent,
+           MAX(CASE WHEN r.recordId IS NOT NULL AND NOT ({LEAVE_NOTE}) THEN r.time END) AS lastCheckin
+    FROM user u
+    LEFT JOIN checkin_record r ON r.uid = u.uid
+    GROUP BY u.uid
+"""
+
+
+def record_checkin(cursor, task_id, uid, time):
+    cursor.execute(UPSERT_CHECKIN, (uid, time))
+    cursor.execute(SETTLED_ABSENT, (task_id, uid))
+
+
+def record_checkins(cursor, entries):
+    # 签到批量写入（checkin_ingest）时在同一事务中调用；entries 为实际插入的 checkin_record 参数
+    if not entries:
+        return
+    cursor.executemany(UPSERT_CHECKIN, [(entry[1], entry[4]) for entry in entries])
+    cursor.executemany(SETTLED_ABSENT, [(entry[0], entry[1]) for entry in entries])
+
+
+def record_leave(cursor, task_id, uid):
+    cursor.execute(UPSERT_LEAVE, (uid,))
+    cursor.execute(SETTLED_ABSENT, (task_id, uid))
+
+
+def close_expired(conn, now=None):
+    # 结算已过期且未结算的任务：全体 eligible+1，无记录者 absent+1。
+    # 先把 summarized 置 1 抢占任务，多个进程同时执行时每个任务只结算一次
+    now = now or datetime.datetime.now()
+    cursor = conn.cursor()
+    cursor.execute("SELECT taskId FROM checkin_task WHERE summarized=0 AND expireTime < %s ORDER BY taskId",
+                   (now,))
+    task_ids = [row[0] for row in cursor.fetchall()]
+    closed = 0
+    for task_id in task_ids:
+        cursor.execute("UPDATE checkin_task SET summarized=1 WHERE taskId=%s AND summarized=0", (task_id,))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            continue
+        cursor.execute("""INSERT INTO attendance_summary(uid, eligible, absent)
+                          SELECT u.uid, 1, IF(r.recordId IS NULL, 1, 0)
+                          FROM user u
+                          LEFT JOIN checkin_record r ON r.uid = u.uid AND r.taskId = %s
+                          ON DUPLICATE KEY UPDATE eligible=eligible+1, absent=absent+VALUES(absent)""",
+                       (task_id,))
+        conn.commit()
+        closed += 1
+    return closed
+
+
+def rebuild(conn, now=None):
+    now = now or datetime.datetime.now()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE checkin_task SET summarized=IF(expireTime < %s, 1, 0)", (now,))
+    cursor.execute("DELETE FROM attendance_summary")
+    cursor.execute(f"INSERT INTO attendance_summary({', '.join(SUMMARY_COLUMNS)}) " + REBUILD_SELECT)
+    conn.commit()
+
+
+def verify(conn):
+    # 与全量计算结果逐行比较，返回不一致的学号及差异
+    cursor = conn.cursor()
+    cursor.execute(REBUILD_SELECT)
+    expected = {row[0]: row[1:] for row in cursor.fetchall()}
+    cursor.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM attendance_summary")
+    actual = {row[0]: row[1:] for row in cursor.fetchall()}
+    empty = (0, 0, 0, 0, None)
+    diffs = []
+    for uid in sorted(set(expected) | set(actual)):
+        a = tuple(actual.get(uid, empty))
+        e = tuple(expected.get(uid, empty))
+        if a != e:
+            diffs.append((uid, a, e))
+    return diffs
+
+
+def stats(conn, uid=None):
+    cursor = conn.cursor()
+    query = ("SELECT s.uid, u.name, s.eligible, s.checkedIn, s.onLeave, s.absent, s.lastCheckin "
+             "FROM attendance_summary s JOIN user u ON s.uid = u.uid")
+    params = ()
+    if uid:
+        query += " WHERE s.uid=%s"
+        params = (uid,)
+    cursor.execute(query + " ORDER BY s.uid", params)
+    columns = [description[0] for description in cursor.description]
+    items = []
+    for row in cursor.fetchall():
+        item = dict(zip(columns, row))
+        item['rate'] = round((item['eligible'] - item['absent']) / item['eligible'], 4) if item['eligible'] else None
+        items.append(item)
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="考勤汇总表维护")
+    parser.add_argument('command', choices=['close', 'rebuild', 'verify'],
+                        help="close: 结算已过期任务；rebuild: 全量重建；verify: 与全量计算结果比对")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = db_pool.connect()
+    try:
+        if args.command == 'close':
+            print(f"结算 {close_expired(conn)} 个任务")
+        elif args.command == 'rebuild':
+            rebuild(conn)
+            print("重建完成")
+        else:
+            diffs = verify(conn)
+            for uid, actual, expected in diffs:
+                print(f"{uid}: 汇总表 {actual} != 全量计算 {expected}")
+            print("一致" if not diffs else f"{len(diffs)} 个学号不一致")
+            return 1 if diffs else 0
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
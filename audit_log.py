@@ -0,0 +1,13 @@
+import atexit
+import datetime
+
+from batch_writer import BatchWriter
+
+INSERT_LOG = "INSERT INTO log(uid, info, time) VALUES(%s, %s, %s)"
+
+writer = BatchWriter('log', INSERT_LOG)
+atexit.register(writer.close)
+
+
+def write(uid, info):
+    writer.write((uid, info, datetime.datetime.now()))
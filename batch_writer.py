@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+from db_pool import pooled_connection
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    # 待写入的行先进入进程内队列，由后台线程按批量/时间间隔一次 executemany 写入。
+    # 从队列取出到提交完成之间的行记在 _inflight 中，与队列由同一把锁保护
+
+    def __init__(self, name, statement, batch_size=None, interval=None, max_queue=None, sync=None, on_write=None,
+                 on_failure=None, prepare=None):
+        self.name = name
+        self.statement = statement
+        # prepare(cursor, entries) 在同一事务中先执行，返回实际要写入的行；
+        # on_write(cursor, entries) 在同一事务中对实际写入的行执行附加写入；
+        # on_failure(entries) 在重试用尽、这批数据最终写入失败时调用
+        self.prepare = prepare
+        self.on_write = on_write
+        self.on_failure = on_failure
+        self.batch_size = batch_size or int(os.getenv(f"{name}.batch_size", 200))
+        self.interval = interval or float(os.getenv(f"{name}.flush_interval", 1.0))
+        self.max_queue = max_queue or int(os.getenv(f"{name}.max_queue", 10000))
+        self.sync = os.getenv(f"{name}.sync", "0") == "1" if sync is None else sync
+        self.retries = int(os.getenv(f"{name}.retries", 3))
+        self.retry_delay = float(os.getenv(f"{name}.retry_delay", 0.5))
+        self._items = None
+        self._inflight = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # fork 后子进程没有写入线程，重新创建队列与线程
+            self._cond = threading.Condition()
+            self._items = deque()
+            self._inflight = []
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-writer', daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def write(self, entry):
+        if self.sync:
+            self._write([entry])
+            return
+        self._ensure_started()
+        with self._cond:
+            if len(self._items) < self.max_queue:
+                self._items.append(entry)
+                self._cond.notify()
+                return
+        # 队列已满时由调用方同步写出，内存占用不超过 max_queue
+        self.flush()
+        with self._cond:
+            self._inflight.append(entry)
+        self._commit([entry])
+
+    def _take(self, limit, deadline=None):
+        # 调用方持有 self._cond；逐行从队列移到 _inflight，deadline 为空时不等待新行
+        entries = []
+        while len(entries) < limit:
+            if not self._items:
+                remaining = deadline - time.monotonic() if deadline is not None else 0
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                continue
+            entry = self._items.popleft()
+            entries.append(entry)
+            self._inflight.append(entry)
+        return entries
+
+    def _commit(self, entries):
+        # 写入（含重试与 on_failure）结束后才从 _inflight 移除
+        try:
+            self._write(entries)
+        finally:
+            with self._cond:
+                for entry in entries:
+                    self._inflight.remove(entry)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._cond:
+                if not self._items:
+                    self._cond.wait(self.interval)
+                if not self._items:
+                    continue
+                entries = self._take(self.batch_size, time.monotonic() + self.interval)
+            with self._flush_lock:
+                self._commit(entries)
+
+    def flush(self):
+        if self._items is None or self._pid != os.getpid():
+            return
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    entries = self._take(self.batch_size)
+                if not entries:
+                    break
+                self._commit(entries)
+
+    def pending(self):
+        # 已入队或已取出但尚未提交的行（包括后台线程正在凑批、正在写入的行）
+        if self._items is None or self._pid != os.getpid():
+            return []
+        with self._cond:
+            return list(self._inflight) + list(self._items)
+
+    def _write_once(self, entries):
+        with pooled_connection() as conn:
+            try:
+                cursor = conn.cursor()
+                if self.prepare is not None:
+                    entries = self.prepare(cursor, entries)
+                if entries:
+                    cursor.executemany(self.statement, entries)
+                if self.on_write is not None:
+                    self.on_write(cursor, entries)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def _write(self, entries):
+        # 失败后按指数退避重试（整批在一个事务中，重试不会重复写入）；
+        # 重试用尽则记录错误并交给 on_failure 处理，不静默丢弃
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                self._write_once(entries)
+                return True
+            except mysql.connector.Error as err:
+                error = err
+                if attempt == self.retries:
+                    break
+                logger.warning("%s: 写入 %d 行失败，%.1f 秒后第 %d 次重试", self.name, len(entries), delay, attempt + 1,
+                               exc_info=True)
+                time.sleep(delay)
+                delay *= 2
+        logger.error("%s: 写入 %d 行失败，已放弃：%r", self.name, len(entries), entries, exc_info=error)
+        if self.on_failure is not None:
+            self.on_failure(entries)
+        return False
+
+    def close(self):
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.interval * 2)
+        self.flush()
+
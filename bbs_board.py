@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import deque
+
+from db_pool import connection
+
+COLUMNS = ('id', 'content', 'time')
+
+
+class MessageBoard:
+    # 最新 N 条留言保存在环形缓冲区中，POST 时并入；GET 只返回 since_id 之后的留言，
+    # 可长轮询等待新留言。多进程部署时每隔 refresh 秒从数据库补齐其他 worker 的新留言。
+    # 自增 id 不一定按顺序提交（大 id 可能先提交），刷新时回读最后 overlap 个 id 并按 id 合并
+
+    def __init__(self, size=None, refresh=None, overlap=None):
+        self.size = size or int(os.getenv("bbs.buffer_size", 200))
+        self.refresh = refresh or float(os.getenv("bbs.refresh", 5))
+        self.overlap = overlap or int(os.getenv("bbs.overlap", 50))
+        self._buffer = None
+        self._refreshed_at = 0.0
+        self._cond = threading.Condition()
+        self._refresh_lock = threading.Lock()
+
+    def _query(self, query, params):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+
+    def _last_id(self):
+        return self._buffer[-1]['id'] if self._buffer else 0
+
+    def _merge(self, rows):
+        # 调用方持有 self._cond；按 id 去重合并后保留最新的 size 条
+        known = {row['id'] for row in self._buffer}
+        new = [row for row in rows if row['id'] not in known]
+        if not new:
+            return
+        merged = sorted(list(self._buffer) + new, key=lambda row: row['id'])
+        self._buffer = deque(merged[-self.size:], maxlen=self.size)
+        self._cond.notify_all()
+
+    def _ensure_loaded(self):
+        if self._buffer is not None and time.monotonic() - self._refreshed_at < self.refresh:
+            return
+        with self._refresh_lock:
+            if self._buffer is not None and time.monotonic() - self._refreshed_at < self.refresh:
+                return
+            if self._buffer is None:
+                rows = self._query("SELECT id, content, time FROM bbs ORDER BY id DESC LIMIT %s", (self.size,))
+                with self._cond:
+                    self._buffer = deque(reversed(rows), maxlen=self.size)
+                    self._cond.notify_all()
+            else:
+                rows = self._query("SELECT id, content, time FROM bbs WHERE id > %s ORDER BY id LIMIT %s",
+                                   (self._last_id() - self.overlap, self.size + self.overlap))
+                with self._cond:
+                    self._merge(rows)
+            self._refreshed_at = time.monotonic()
+
+    def post(self, content):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO bbs(content) VALUES(%s)", (content,))
+            conn.commit()
+            cursor.execute("SELECT id, content, time FROM bbs WHERE id=%s", (cursor.lastrowid,))
+            row = dict(zip(COLUMNS, cursor.fetchone()))
+        if self._buffer is None:
+            return row
+        with self._cond:
+            contiguous = row['id'] <= self._last_id() + 1
+            self._merge([row])
+        if contiguous:
+            return row
+        # 中间可能有其他 worker 的留言尚未进入缓冲区，立即从数据库补齐
+        self._refreshed_at = 0.0
+        self._ensure_loaded()
+        return row
+
+    def latest(self, limit):
+        self._ensure_loaded()
+        with self._cond:
+            return list(reversed(self._buffer))[:limit]
+
+    def since(self, since_id, limit):
+        # 返回 id > since_id 的留言（新的在前）；超出缓冲区范围时查询数据库
+        self._ensure_loaded()
+        with self._cond:
+            if not self._buffer or since_id >= self._buffer[0]['id'] - 1:
+                items = [row for row in reversed(self._buffer) if row['id'] > since_id]
+                return items[:limit]
+        return self._query("SELECT id, content, time FROM bbs WHERE id > %s ORDER BY id DESC LIMIT %s",
+                           (since_id, limit))
+
+    def wait(self, since_id, timeout):
+        # 长轮询：等到有 id > since_id 的留言或超时
+        deadline = time.monotonic() + timeout
+        while True:
+            self._ensure_loaded()
+            remaining = deadline - time.monotonic()
+            with self._cond:
+                if self._last_id() > since_id or remaining <= 0:
+                    return
+                self._cond.wait(min(remaining, self.refresh))
+
+    def before(self, before_id, limit):
+        # 历史留言 keyset 分页
+        self._ensure_loaded()
+        with self._cond:
+            if self._buffer and before_id > self._buffer[0]['id']:
+                items = [row for row in reversed(self._buffer) if row['id'] < before_id][:limit]
+                # 缓冲区未满说明已包含全部留言
+                if len(items) == limit or len(self._buffer) < self.size:
+                    return items
+        return self._query("SELECT id, content, time FROM bbs WHERE id < %s ORDER BY id DESC LIMIT %s",
+                           (before_id, limit))
+
+
+board = MessageBoard()
@@ -0,0 +1,181 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from des_util import raw_str_enc
+from metrics import CAS_SECONDS, DES_SECONDS
+
+DEFAULT_LOGIN_URL = "https://cas.shnu.edu.cn/cas/login?service=http%3A%2F%2Fcourse.shnu.edu.cn%2Feams%2Flogin.action"
+
+_INPUT_RE = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+_ATTR_RE = re.compile(r'([\w-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+
+class CasUnavailable(Exception):
+    pass
+
+
+def _config(key, default):
+    return type(default)(os.getenv(f"cas.{key}", default))
+
+
+def login_url():
+    return os.getenv("cas.url") or DEFAULT_LOGIN_URL
+
+
+def extract_tokens(html):
+    # 只扫描 <input> 标签读取 lt 与 execution，不做完整的 HTML 解析
+    lt_value = ''
+    execution = "e1s1"
+    for match in _INPUT_RE.finditer(html):
+        attrs = {m.group(1).lower(): m.group(2) if m.group(2) is not None else m.group(3)
+                 for m in _ATTR_RE.finditer(match.group(0))}
+        if attrs.get('id') == 'lt':
+            lt_value = attrs.get('value', '')
+        elif attrs.get('name') == 'execution':
+            execution = attrs.get('value', execution)
+    return lt_value, execution
+
+
+class CircuitBreaker:
+    # 连续失败达到阈值后熔断，冷却期内直接失败；冷却结束放行一个试探请求
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class CasClient:
+
+    def __init__(self, url=None, connect_timeout=None, read_timeout=None,
+                 pool_size=None, workers=None, failure_threshold=None, reset_timeout=None):
+        self.url = url or login_url()
+        self.timeout = (connect_timeout or _config('connect_timeout', 3.0),
+                        read_timeout or _config('read_timeout', 10.0))
+        pool_size = pool_size or _config('pool_size', 10)
+        workers = workers or _config('workers', 8)
+        # 所有登录共用一个长连接池；每次登录仍使用独立的 Session 保存 CAS 的 cookie
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cas')
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self.breaker = CircuitBreaker(failure_threshold or _config('failure_threshold', 5),
+                                      reset_timeout or _config('reset_timeout', 30.0))
+
+    def _session(self):
+        session = requests.Session()
+        session.mount('http://', self._adapter)
+        session.mount('https://', self._adapter)
+        return session
+
+    def _login(self, username, password):
+        session = self._session()
+        try:
+            with CAS_SECONDS.time('get'):
+                response = session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            lt_value, execution = extract_tokens(response.text)
+            with DES_SECONDS.time('raw_str_enc'):
+                rsa = raw_str_enc(username + password + lt_value)
+            data = {
+                "rsa": rsa,
+                "ul": len(username),
+                "pl": len(password),
+                "lt": lt_value,
+                "execution": execution,
+                "_eventId": "submit",
+            }
+            post_headers = {
+                "content-type": "application/x-www-form-urlencoded",
+                "referer": self.url,
+            }
+            with CAS_SECONDS.time('post'):
+                response = session.post(self.url, data=data, headers=post_headers, timeout=self.timeout)
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except requests.RequestException as err:
+            self.breaker.failure()
+            raise CasUnavailable(str(err)) from err
+        except BaseException:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return "我的账户" in response.text
+
+    def login(self, username, password):
+        # 在有界线程池中完成一次 CAS 登录，返回账号密码是否正确
+        if not self._slots.acquire(blocking=False):
+            raise CasUnavailable("CAS 登录排队已满")
+        if not self.breaker.allow():
+            self._slots.release()
+            raise CasUnavailable("CAS 熔断中")
+        try:
+            future = self._executor.submit(self._login, username, password)
+        except BaseException:
+            self._slots.release()
+            self.breaker.failure()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=sum(self.timeout) * 2)
+        except FutureTimeoutError as err:
+            raise CasUnavailable("CAS 登录超时") from err
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._adapter.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # 每个进程一个客户端，fork 后在子进程中重新创建
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = CasClient()
+                _client_pid = pid
+    return _client
+
+
+def cas_login(username, password):
+    return get_client().login(username, password)
@@ -0,0 +1,130 @@
+import atexit
+import os
+import threading
+from collections import OrderedDict
+
+import attendance_summary
+from batch_writer import BatchWriter
+from db_pool import connection
+
+# (taskId, uid) 唯一索引兜底，重复行由数据库忽略
+INSERT_RECORD = ("INSERT IGNORE INTO checkin_record(taskId, uid, longitude, latitude, time, note) "
+                 "VALUES(%s, %s, %s, %s, %s, %s)")
+
+ACCEPTED = 'accepted'
+DUPLICATE = 'duplicate'
+NO_TASK = 'no_task'
+NO_USER = 'no_user'
+
+
+def new_records(cursor, entries):
+    # 锁定读已有的 (taskId, uid)，只写入并汇总真正新增的记录：其他进程已写入、
+    # 或任务集合被淘汰后重新加载期间重复提交的签到不会被重复计入 attendance_summary
+    unique = {}
+    for entry in entries:
+        unique.setdefault((entry[0], entry[1]), entry)
+    placeholders = ", ".join(["(%s, %s)"] * len(unique))
+    cursor.execute(f"SELECT taskId, uid FROM checkin_record WHERE (taskId, uid) IN ({placeholders}) FOR UPDATE",
+                   tuple(value for key in unique for value in key))
+    existing = {(task_id, uid) for task_id, uid in cursor.fetchall()}
+    return [entry for key, entry in unique.items() if key not in existing]
+
+
+def enabled():
+    return os.getenv("checkin.write_behind", "0") == "1"
+
+
+class CheckinIngest:
+    # 签到高峰写入：内存中按任务记录已签到学号，立即应答，记录由后台批量写入。
+    # 已签到集合只在本进程内，多进程部署时重复签到落到其他 worker 会被 INSERT IGNORE 吞掉，
+    # 因此开启写后批量入库时只能运行单个 worker（gunicorn.conf.py 会自动限制）
+
+    def __init__(self, max_tasks=None):
+        self.max_tasks = max_tasks or int(os.getenv("checkin.max_tasks", 64))
+        self.writer = BatchWriter('checkin', INSERT_RECORD, prepare=new_records,
+                                  on_write=attendance_summary.record_checkins, on_failure=self._write_failed)
+        self._seen = OrderedDict()
+        self._tasks = set()
+        self._users = set()
+        self._lock = threading.Lock()
+
+    def _load_seen(self, task_id):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT uid FROM checkin_record WHERE taskId=%s", (task_id,))
+            return {row[0] for row in cursor.fetchall()}
+
+    def _exists(self, query, key):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, (key,))
+            return cursor.fetchone() is not None
+
+    def _seen_set(self, task_id):
+        # 调用方持有 self._lock；只保留最近使用的 max_tasks 个任务
+        seen = self._seen.get(task_id)
+        if seen is None:
+            seen = self._load_seen(task_id)
+            self._seen[task_id] = seen
+            while len(self._seen) > self.max_tasks:
+                self._seen.popitem(last=False)
+        else:
+            self._seen.move_to_end(task_id)
+        return seen
+
+    def _validate(self, task_id, uid):
+        if task_id not in self._tasks:
+            if not self._exists("SELECT taskId FROM checkin_task WHERE taskId=%s", task_id):
+                return NO_TASK
+            self._tasks.add(task_id)
+        if uid not in self._users:
+            if not self._exists("SELECT uid FROM user WHERE uid=%s", uid):
+                return NO_USER
+            self._users.add(uid)
+        return None
+
+    def claim(self, task_id, uid):
+        # 校验并占用 (taskId, uid)，成功返回 ACCEPTED
+        task_id = int(task_id)
+        uid = str(uid)
+        error = self._validate(task_id, uid)
+        if error:
+            return error
+        with self._lock:
+            seen = self._seen_set(task_id)
+            if uid in seen:
+                return DUPLICATE
+            seen.add(uid)
+        return ACCEPTED
+
+    def release(self, task_id, uid):
+        with self._lock:
+            seen = self._seen.get(int(task_id))
+            if seen is not None:
+                seen.discard(str(uid))
+
+    def _write_failed(self, entries):
+        # 这些签到已应答“签到成功”却未能入库：释放占用，学生重新签到时不会被判为重复
+        for entry in entries:
+            self.release(entry[0], entry[1])
+
+    def submit(self, task_id, uid, longitude, latitude, time, note):
+        status = self.claim(task_id, uid)
+        if status == ACCEPTED:
+            self.writer.write((int(task_id), str(uid), longitude, latitude, time, note))
+        return status
+
+    def pending(self, task_id):
+        # 该任务已应答但尚未入库的签到 (uid, 经度, 纬度)
+        task_id = int(task_id)
+        return [(entry[1], entry[2], entry[3]) for entry in self.writer.pending() if entry[0] == task_id]
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+ingest = CheckinIngest()
+atexit.register(ingest.close)
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors, pooling
+from flask import g, has_app_context
+
+from metrics import TimedCursor
+
+# 连接池按进程创建：fork 出来的 worker 不会共用父进程的连接
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _config():
+    return {
+        'host': os.getenv("db.host"),
+        'user': os.getenv("db.user"),
+        'password': os.getenv("db.password"),
+        'database': os.getenv("db.database"),
+        # 归还连接前自动读掉未取完的结果集，避免 reset_session 失败
+        'consume_results': True,
+    }
+
+
+def connect():
+    # 命令行工具使用的独立连接
+    return mysql.connector.connect(**_config())
+
+
+def pool_size():
+    # 默认每个线程一个连接，再给后台线程（批量写入、签到推送）留 4 个
+    size = os.getenv("db.pool_size")
+    if size:
+        return int(size)
+    return min(int(os.getenv("server.threads", 16)) + 4, pooling.CNX_POOL_MAXSIZE)
+
+
+def get_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=f"service_center_{pid}",
+                pool_size=pool_size(),
+                pool_reset_session=True,
+                **_config())
+            _pool_pid = pid
+    return _pool
+
+
+class TimedConnection:
+    # 连接代理：cursor() 返回计时游标（见 metrics.py），其余属性转发给池中的连接
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self.raw.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def checkout(timeout=None):
+    # 从连接池取连接；池耗尽时等待，超时后抛出 PoolError。
+    # 取出时连接池会检查连接是否存活，断线则自动重连
+    if timeout is None:
+        timeout = float(os.getenv("db.pool_timeout", 10))
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        try:
+            return TimedConnection(get_pool().get_connection())
+        except errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+
+def release(conn):
+    if isinstance(conn, TimedConnection):
+        conn = conn.raw
+    try:
+        conn.close()
+    except mysql.connector.Error:
+        # close() 无论会话能否复位（例如连接已断开）都会把连接放回池中，
+        # 断开的连接在下次取出时由连接池检查并重连
+        pass
+
+
+@contextmanager
+def pooled_connection(timeout=None):
+    # 请求上下文之外（后台线程、命令行工具）使用
+    conn = checkout(timeout)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+@contextmanager
+def connection():
+    # 请求中调用的缓存加载等函数使用：请求内复用本请求的连接（请求结束时归还），
+    # 同一线程不会同时占用两个连接；请求外临时从池中取一个
+    if has_app_context():
+        yield get_db()
+        return
+    with pooled_connection() as conn:
+        yield conn
+
+
+def get_db():
+    # 每个请求只取一次连接，请求结束时归还
+    if 'db' not in g:
+        g.db = checkout()
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
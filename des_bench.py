@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import des_util
+
+VECTORS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'des_vectors.json')
+
+ASCII_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*_-"
+CJK_CHARS = "上海师范大学班级内务管理签到收集抽签学生密码"
+# CAS 登录页 lt 令牌的典型形式
+LT_TOKEN = "LT-123456-AbCdEfGhIjKlMnOpQrStUvWxYz0123-cas"
+
+
+def gen_inputs(seed=20231206):
+    # 学号 + 密码 + lt，覆盖 ASCII/中文密码、长度 1~64、有无 lt
+    rnd = random.Random(seed)
+    inputs = []
+    for length in list(range(1, 17)) + [24, 32, 48, 64]:
+        for chars in (ASCII_CHARS, CJK_CHARS):
+            password = "".join(rnd.choice(chars) for _ in range(length))
+            username = str(rnd.randint(1000000000, 1999999999))
+            inputs.append(username + password)
+            inputs.append(username + password + LT_TOKEN)
+    for length in range(1, 9):
+        inputs.append("".join(rnd.choice(ASCII_CHARS + CJK_CHARS) for _ in range(length)))
+    return inputs
+
+
+def freeze():
+    # 以字符串版参考实现生成金标准向量
+    vectors = [{'input': data, 'hex': des_util.raw_str_enc_bt(data)} for data in gen_inputs()]
+    with open(VECTORS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(vectors, f, ensure_ascii=False, indent=1)
+    print(f"写入 {len(vectors)} 条向量到 {VECTORS_FILE}")
+
+
+def load_vectors():
+    with open(VECTORS_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify(vectors):
+    failed = 0
+    inputs = [v['input'] for v in vectors]
+    expected = [v['hex'] for v in vectors]
+    engines = {
+        'raw_str_enc': lambda: [des_util.raw_str_enc(data) for data in inputs],
+        'raw_str_enc_bt': lambda: [des_util.raw_str_enc_bt(data) for data in inputs],
+        'raw_str_enc_many': lambda: des_util.raw_str_enc_many(inputs),
+    }
+    for name, run in engines.items():
+        bad = [i for i, (a, b) in enumerate(zip(run(), expected)) if a != b]
+        status = "OK" if not bad else f"FAIL ({len(bad)} 条不一致，首条: {inputs[bad[0]]!r})"
+        print(f"{name:<20} {status}")
+        failed += len(bad)
+    return failed == 0
+
+
+def measure(func, args_list, min_time):
+    # 先计时，再用 tracemalloc 单独统计单次调用的内存分配峰值，避免追踪开销影响计时
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for args in args_list:
+            func(*args)
+        calls += len(args_list)
+        elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    peak = 0
+    for args in args_list:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func(*args)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return calls / elapsed, peak
+
+
+def benchmark(inputs, min_time):
+    key_bt = des_util.get_key_bytes("1")
+    blocks = [des_util.str_to_bt(des_util.split_blocks(data)[0]) for data in inputs]
+    chain_keys = [des_util.get_key_bytes(k) for k in ("1", "2", "3")]
+    cases = [
+        ('str_to_bt', des_util.str_to_bt, [(data[:4],) for data in inputs]),
+        ('gen_key', des_util.gen_key, [(key_bt[0],)]),
+        ('enc', des_util.enc, [(bt, key_bt[0]) for bt in blocks[:8]]),
+        ('process_bt', des_util.process_bt, [(bt, *chain_keys) for bt in blocks]),
+        ('raw_str_enc_bt', des_util.raw_str_enc_bt, [(data,) for data in inputs[:8]]),
+        ('raw_str_enc', des_util.raw_str_enc, [(data,) for data in inputs]),
+        ('raw_str_enc_many', des_util.raw_str_enc_many, [(inputs,)]),
+    ]
+    results = []
+    print(f"{'函数':<20}{'ops/sec':>14}{'分配峰值字节/次':>18}")
+    for name, func, args_list in cases:
+        ops, peak = measure(func, args_list, min_time)
+        results.append({'name': name, 'ops_per_sec': ops, 'alloc_peak_bytes_per_call': peak})
+        print(f"{name:<20}{ops:>14.1f}{peak:>18}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="des_util 基准测试与金标准向量校验")
+    parser.add_argument('--freeze', action='store_true', help="用参考实现重新生成 des_vectors.json")
+    parser.add_argument('--verify-only', action='store_true', help="只校验金标准向量")
+    parser.add_argument('--min-time', type=float, default=0.5, help="每项计时的最短秒数")
+    parser.add_argument('--json', help="把基准结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    if args.freeze:
+        freeze()
+        return 0
+    vectors = load_vectors()
+    if not verify(vectors):
+        return 1
+    if args.verify_only:
+        return 0
+    results = benchmark([v['input'] for v in vectors], args.min_time)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,19 @@
+from functools import lru_cache
+
+# numpy 只用于批量加密，首次调用 raw_str_enc_many 时再导入
+np = None
+
+
+@lru_cache(maxsize=1)
+def _load_numpy():
+    global np
+    try:
+        import numpy
+    except ImportError:
+        return False
+    np = numpy
+    return True
+
 # 初始置换 IP
 IP_TABLE = [58, 50, 42, 34, 26, 18, 10, 2,
             60, 52, 44, 36, 28, 20, 12, 4,
@@ -87,6 +103,15 @@ MOVE_TABLE = [1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1]
 
 
 def process_bt(temp_bt, first_key_bt, second_key_bt, third_key_bt):
+    # 子密钥按密钥块缓存，只执行轮函数
+    chain = DesChain.from_key_blocks(
+        [bt_to_int(bt) for bt in first_key_bt],
+        [bt_to_int(bt) for bt in second_key_bt],
+        [bt_to_int(bt) for bt in third_key_bt])
+    return int_to_bt(chain.encrypt_block(bt_to_int(temp_bt)))
+
+
+def _process_bt_str(temp_bt, first_key_bt, second_key_bt, third_key_bt):
     for i in range(len(first_key_bt)):
         temp_bt = enc(temp_bt, first_key_bt[i])
     for i in range(len(second_key_bt)):
@@ -96,7 +121,7 @@ def process_bt(temp_bt, first_key_bt, second_key_bt, third_key_bt):
     return temp_bt
 
 
-def raw_str_enc(data, first_key="1", second_key="2", third_key="3"):
+def raw_str_enc_bt(data, first_key="1", second_key="2", third_key="3"):
     length = len(data)
     enc_data = ""
     first_key_bt = get_key_bytes(first_key)
@@ -105,16 +130,16 @@ def raw_str_enc(data, first_key="1", second_key="2", third_key="3"):
 
     if length > 0:
         if length < 4:
-            enc_data = bt64_to_hex(process_bt(str_to_bt(data), first_key_bt, second_key_bt, third_key_bt))
+            enc_data = bt64_to_hex(_process_bt_str(str_to_bt(data), first_key_bt, second_key_bt, third_key_bt))
         else:
             iterator = int(length / 4)
             remainder = length % 4
             for i in range(iterator):
                 enc_data = enc_data + bt64_to_hex(
-                    process_bt(str_to_bt(data[i * 4:i * 4 + 4]), first_key_bt, second_key_bt, third_key_bt))
+                    _process_bt_str(str_to_bt(data[i * 4:i * 4 + 4]), first_key_bt, second_key_bt, third_key_bt))
             if remainder > 0:
                 enc_data += bt64_to_hex(
-                    process_bt(str_to_bt(data[iterator * 4 + 0:length]), first_key_bt, second_key_bt, third_key_bt))
+                    _process_bt_str(str_to_bt(data[iterator * 4 + 0:length]), first_key_bt, second_key_bt, third_key_bt))
     return enc_data
 
 
@@ -243,3 +268,227 @@ def enc(bin_message, bin_key):
         ip_right = temp_xor2
 
     return process_change(ip_right + ip_left, IPR_Table)
+
+
+# ---------------- 整数版 DES 引擎 ----------------
+# 以 64 位整数代替 '0'/'1' 字符串，置换与 S/P 盒均使用预计算查表，
+# 输出与上面的字符串实现逐位一致。
+
+def _permute_tables(table, in_bits):
+    # 按输入字节拆分置换：每个字节的 256 种取值预先算出其在输出中的位
+    out_bits = len(table)
+    chunks = in_bits // 8
+    tables = []
+    for c in range(chunks):
+        chunk_table = []
+        for value in range(256):
+            res = 0
+            for i, pos in enumerate(table):
+                bit = pos - 1 - c * 8
+                if 0 <= bit < 8 and (value >> (7 - bit)) & 1:
+                    res |= 1 << (out_bits - 1 - i)
+            chunk_table.append(res)
+        tables.append(chunk_table)
+    return tables
+
+
+def _permute(value, tables, in_bits):
+    res = 0
+    shift = in_bits - 8
+    for chunk_table in tables:
+        res |= chunk_table[(value >> shift) & 0xFF]
+        shift -= 8
+    return res
+
+
+def _sp_tables():
+    # S盒与P盒合并：第 c 个 S 盒的 6 位输入直接映射为 P 置换后的 32 位结果
+    p_tables = _permute_tables(P_BOX_TABLE, 32)
+    tables = []
+    for c in range(8):
+        sp = []
+        for value in range(64):
+            row = ((value >> 4) & 0b10) | (value & 1)
+            col = (value >> 1) & 0xF
+            s = S_BOX_TABLE[c][row * 16 + col] << (28 - 4 * c)
+            sp.append(_permute(s, p_tables, 32))
+        tables.append(sp)
+    return tables
+
+
+# gen_key 中的密钥初始置换，写成与 KEY_TABLE 相同形式的位置表
+PC1_TABLE = [8 * (7 - j) + i + 1 for i in range(7) for j in range(8)]
+
+_IP = _permute_tables(IP_TABLE, 64)
+_IPR = _permute_tables(IPR_Table, 64)
+_PC1 = _permute_tables(PC1_TABLE, 64)
+_PC2 = _permute_tables(KEY_TABLE, 56)
+_SP = _sp_tables()
+_MASK28 = (1 << 28) - 1
+_MASK32 = (1 << 32) - 1
+
+
+def str_to_int(input_str):
+    # 与 str_to_bt 相同：取前 4 个字符的低 16 位，不足 4 个补 0
+    res = 0
+    for i, ch in enumerate(input_str[:4]):
+        res |= (ord(ch) & 0xFFFF) << (48 - 16 * i)
+    return res
+
+
+def bt_to_int(bt):
+    res = 0
+    for bit in bt:
+        res = (res << 1) | int(bit)
+    return res
+
+
+def int_to_bt(value):
+    return format(value, '064b')
+
+
+def int64_to_hex(value):
+    return format(value, '016X')
+
+
+def gen_key_int(key_int):
+    key = _permute(key_int, _PC1, 64)
+    left = key >> 28
+    right = key & _MASK28
+    keys = []
+    for move in MOVE_TABLE:
+        left = ((left << move) | (left >> (28 - move))) & _MASK28
+        right = ((right << move) | (right >> (28 - move))) & _MASK28
+        keys.append(_permute((left << 28) | right, _PC2, 56))
+    return keys
+
+
+def enc_int(message, keys):
+    ip = _permute(message, _IP, 64)
+    left = ip >> 32
+    right = ip & _MASK32
+    sp0, sp1, sp2, sp3, sp4, sp5, sp6, sp7 = _SP
+    for key in keys:
+        # 扩展置换 E：把 R 首尾各补一位后按 4 位步长取 6 位
+        ext = ((right & 1) << 33) | (right << 1) | (right >> 31)
+        f = (sp0[((ext >> 28) ^ (key >> 42)) & 0x3F]
+             | sp1[((ext >> 24) ^ (key >> 36)) & 0x3F]
+             | sp2[((ext >> 20) ^ (key >> 30)) & 0x3F]
+             | sp3[((ext >> 16) ^ (key >> 24)) & 0x3F]
+             | sp4[((ext >> 12) ^ (key >> 18)) & 0x3F]
+             | sp5[((ext >> 8) ^ (key >> 12)) & 0x3F]
+             | sp6[((ext >> 4) ^ (key >> 6)) & 0x3F]
+             | sp7[(ext ^ key) & 0x3F])
+        left, right = right, left ^ f
+    return _permute((right << 32) | left, _IPR, 64)
+
+
+def get_key_ints(key):
+    return [bt_to_int(bt) for bt in get_key_bytes(key)]
+
+
+def split_blocks(data):
+    # 与 raw_str_enc_bt 的分块方式一致：每 4 个字符一块，余下的字符单独成块
+    length = len(data)
+    if length == 0:
+        return []
+    if length < 4:
+        return [data]
+    return [data[i:i + 4] for i in range(0, length, 4)]
+
+
+@lru_cache(maxsize=256)
+def _key_schedule(key_int):
+    return tuple(gen_key_int(key_int))
+
+
+class DesChain:
+    # 三组密钥串联加密，子密钥在构造时一次生成
+
+    def __init__(self, first_key="1", second_key="2", third_key="3"):
+        self.keys = (first_key, second_key, third_key)
+        self._schedules = tuple(_key_schedule(k) for key in self.keys for k in get_key_ints(key))
+
+    @classmethod
+    def from_key_blocks(cls, first_blocks, second_blocks, third_blocks):
+        chain = cls.__new__(cls)
+        chain.keys = None
+        chain._schedules = tuple(_key_schedule(k) for k in (*first_blocks, *second_blocks, *third_blocks))
+        return chain
+
+    def encrypt_block(self, block):
+        for keys in self._schedules:
+            block = enc_int(block, keys)
+        return block
+
+    def encrypt(self, data):
+        return "".join(int64_to_hex(self.encrypt_block(str_to_int(block))) for block in split_blocks(data))
+
+
+@lru_cache(maxsize=32)
+def get_des_chain(first_key="1", second_key="2", third_key="3"):
+    return DesChain(first_key, second_key, third_key)
+
+
+def raw_str_enc(data, first_key="1", second_key="2", third_key="3"):
+    return get_des_chain(first_key, second_key, third_key).encrypt(data)
+
+
+# ---------------- 批量加密 ----------------
+
+@lru_cache(maxsize=1)
+def _np_tables():
+    return (np.array(_IP, dtype=np.uint64),
+            np.array(_IPR, dtype=np.uint64),
+            np.array(_SP, dtype=np.uint64))
+
+
+def _np_permute(values, tables):
+    res = np.zeros_like(values)
+    for c in range(8):
+        res |= tables[c][(values >> np.uint64(56 - 8 * c)) & np.uint64(0xFF)]
+    return res
+
+
+def _np_encrypt_blocks(blocks, schedules):
+    ip_table, ipr_table, sp = _np_tables()
+    mask32 = np.uint64(_MASK32)
+    mask6 = np.uint64(0x3F)
+    one = np.uint64(1)
+    for keys in schedules:
+        ip = _np_permute(blocks, ip_table)
+        left = ip >> np.uint64(32)
+        right = ip & mask32
+        for key in keys:
+            ext = ((right & one) << np.uint64(33)) | (right << one) | (right >> np.uint64(31))
+            f = np.zeros_like(right)
+            for c in range(8):
+                idx = ((ext >> np.uint64(28 - 4 * c)) ^ np.uint64(key >> (42 - 6 * c))) & mask6
+                f |= sp[c][idx]
+            left, right = right, left ^ f
+        blocks = _np_permute((right << np.uint64(32)) | left, ipr_table)
+    return blocks
+
+
+def raw_str_enc_many(strings, first_key="1", second_key="2", third_key="3"):
+    # 一次加密多条字符串，所有 4 字符块打包成 uint64 数组后整体执行 16 轮运算
+    chain = get_des_chain(first_key, second_key, third_key)
+    strings = list(strings)
+    if not _load_numpy():
+        return [chain.encrypt(data) for data in strings]
+    counts = []
+    blocks = []
+    for data in strings:
+        data_blocks = split_blocks(data)
+        counts.append(len(data_blocks))
+        blocks.extend(str_to_int(block) for block in data_blocks)
+    if not blocks:
+        return ["" for _ in strings]
+    encrypted = _np_encrypt_blocks(np.array(blocks, dtype=np.uint64), chain._schedules)
+    hex_blocks = [int64_to_hex(int(value)) for value in encrypted]
+    result = []
+    start = 0
+    for count in counts:
+        result.append("".join(hex_blocks[start:start + count]))
+        start += count
+    return result
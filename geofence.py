@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+# numpy 在首次打分时再导入，不拖慢 worker 启动
+np = None
+
+import checkin_ingest
+from db_pool import connection
+
+EARTH_RADIUS = 6371008.8
+
+OUT_OF_FENCE = 'out_of_fence'
+SHARED_COORDS = 'shared_coords'
+CLUSTER = 'cluster'
+
+
+@lru_cache(maxsize=1)
+def _load_numpy():
+    global np
+    try:
+        import numpy
+    except ImportError:
+        return False
+    np = numpy
+    return True
+
+
+def haversine(lng1, lat1, lng2, lat2):
+    # 向量化的球面距离（米），参数为角度，可广播
+    lng1, lat1, lng2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lng1, lat1, lng2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+RECORDS_QUERY = ("SELECT recordId, uid, longitude, latitude FROM checkin_record "
+                 "WHERE taskId=%s AND recordId > %s AND longitude IS NOT NULL AND latitude IS NOT NULL "
+                 "ORDER BY recordId")
+
+
+class TaskScore:
+    # 单个签到任务的打分状态：坐标数组、各点附近的其他签到数、相同坐标的学号。
+    # last_record_id / synced_at 记录已从数据库读到的位置，用于增量对账
+
+    def __init__(self, fence, cluster_radius, cluster_min, capacity=256):
+        self.fence = fence
+        self.last_record_id = 0
+        self.synced_at = time.monotonic()
+        self.cluster_radius = cluster_radius
+        self.cluster_min = cluster_min
+        self.uids = []
+        self.index = {}
+        self.lng = np.empty(capacity)
+        self.lat = np.empty(capacity)
+        self.neighbors = np.zeros(capacity, dtype=np.int64)
+        self.coords = {}
+
+    @property
+    def size(self):
+        return len(self.uids)
+
+    def _grow(self):
+        capacity = len(self.lng) * 2
+        for name in ('lng', 'lat', 'neighbors'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def load(self, rows):
+        # 全量一次向量化计算：两两距离矩阵得到每个点附近的签到数
+        rows = [(uid, float(lng), float(lat)) for uid, lng, lat in rows if uid not in self.index]
+        while self.size + len(rows) > len(self.lng):
+            self._grow()
+        start = self.size
+        for i, (uid, lng, lat) in enumerate(rows):
+            self.uids.append(uid)
+            self.index[uid] = start + i
+            self.lng[start + i] = lng
+            self.lat[start + i] = lat
+            self.coords.setdefault((lng, lat), set()).add(uid)
+        n = self.size
+        if n:
+            lng = self.lng[:n]
+            lat = self.lat[:n]
+            distances = haversine(lng[:, None], lat[:, None], lng[None, :], lat[None, :])
+            self.neighbors[:n] = (distances <= self.cluster_radius).sum(axis=1) - 1
+
+    def add(self, uid, lng, lat):
+        # 增量更新：只计算新点到已有各点的距离
+        if uid in self.index:
+            return
+        lng = float(lng)
+        lat = float(lat)
+        n = self.size
+        if n == len(self.lng):
+            self._grow()
+        if n:
+            close = haversine(self.lng[:n], self.lat[:n], lng, lat) <= self.cluster_radius
+            self.neighbors[:n] += close
+            self.neighbors[n] = int(close.sum())
+        else:
+            self.neighbors[n] = 0
+        self.uids.append(uid)
+        self.index[uid] = n
+        self.lng[n] = lng
+        self.lat[n] = lat
+        self.coords.setdefault((lng, lat), set()).add(uid)
+
+    def flags(self):
+        n = self.size
+        result = {uid: [] for uid in self.uids}
+        if not n:
+            return result
+        if self.fence is not None:
+            center_lng, center_lat, radius = self.fence
+            outside = haversine(self.lng[:n], self.lat[:n], center_lng, center_lat) > radius
+            for i in np.flatnonzero(outside):
+                result[self.uids[i]].append(OUT_OF_FENCE)
+        for uids in self.coords.values():
+            if len(uids) > 1:
+                for uid in uids:
+                    result[uid].append(SHARED_COORDS)
+        for i in np.flatnonzero(self.neighbors[:n] >= self.cluster_min - 1):
+            result[self.uids[i]].append(CLUSTER)
+        return result
+
+
+class GeofenceScorer:
+    # 按任务缓存打分状态：首次查看签到记录时加载，之后随本进程的签到增量更新。
+    # 多进程部署时其他 worker 的签到不会经过本进程，查看时每隔 refresh 秒
+    # 从数据库补读 recordId 更大的签到
+
+    def __init__(self, max_tasks=None, cluster_radius=None, cluster_min=None, refresh=None):
+        self.max_tasks = max_tasks or int(os.getenv("geofence.max_tasks", 32))
+        # cluster_radius 米内聚集 cluster_min 个及以上签到视为异常聚集
+        self.cluster_radius = cluster_radius or float(os.getenv("geofence.cluster_radius", 3))
+        self.cluster_min = cluster_min or int(os.getenv("geofence.cluster_min", 5))
+        self.refresh = refresh or float(os.getenv("geofence.refresh", 5))
+        # 自增 id 不一定按顺序提交，补读时回退 overlap 个 id，重复的学号由 add 去重
+        self.overlap = int(os.getenv("geofence.overlap", 100))
+        self._tasks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return _load_numpy()
+
+    def _load(self, task_id):
+        # 写后批量入库时合并队列中尚未入库的签到；先取队列再查库，两边都有的按学号去重。
+        # 不在请求线程中 flush，避免同时占用请求连接和写入连接。
+        # 查库复用请求连接，须在请求事务的第一次读取（快照建立）之前调用
+        pending = checkin_ingest.ingest.pending(task_id) if checkin_ingest.enabled() else []
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT centerLng, centerLat, radius FROM checkin_task WHERE taskId=%s", (task_id,))
+            task = cursor.fetchone()
+            if task is None:
+                return None
+            cursor.execute(RECORDS_QUERY, (task_id, 0))
+            records = cursor.fetchall()
+        fence = tuple(float(v) for v in task) if None not in task else None
+        score = TaskScore(fence, self.cluster_radius, self.cluster_min)
+        rows = [(uid, lng, lat) for _, uid, lng, lat in records]
+        score.load(list({row[0]: row for row in rows + pending}.values()))
+        if records:
+            score.last_record_id = records[-1][0]
+        return score
+
+    def _sync(self, task_id, score):
+        # 补读其他 worker 写入的签到；同一学号已在打分状态中时 add 不做任何事
+        with self._lock:
+            if time.monotonic() - score.synced_at < self.refresh:
+                return
+            score.synced_at = time.monotonic()
+            last_record_id = score.last_record_id
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(RECORDS_QUERY, (task_id, max(last_record_id - self.overlap, 0)))
+            records = cursor.fetchall()
+        if not records:
+            return
+        with self._lock:
+            for _, uid, lng, lat in records:
+                score.add(uid, lng, lat)
+            score.last_record_id = max(score.last_record_id, records[-1][0])
+
+    def _get(self, task_id):
+        with self._lock:
+            score = self._tasks.get(task_id)
+            if score is not None:
+                self._tasks.move_to_end(task_id)
+        if score is not None:
+            self._sync(task_id, score)
+            return score
+        score = self._load(task_id)
+        if score is None:
+            return None
+        with self._lock:
+            score = self._tasks.setdefault(task_id, score)
+            while len(self._tasks) > self.max_tasks:
+                self._tasks.popitem(last=False)
+        return score
+
+    def add(self, task_id, uid, lng, lat):
+        # 签到成功后调用；该任务尚未加载时不做任何事，查看时会从数据库加载
+        if not self.available:
+            return
+        with self._lock:
+            score = self._tasks.get(str(task_id))
+            if score is not None:
+                score.add(str(uid), lng, lat)
+
+    def invalidate(self, task_id):
+        with self._lock:
+            self._tasks.pop(str(task_id), None)
+
+    def flags(self, task_id):
+        if not self.available:
+            return {}
+        score = self._get(str(task_id))
+        if score is None:
+            return {}
+        with self._lock:
+            return score.flags()
+
+
+scorer = GeofenceScorer()
@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("server.bind", "0.0.0.0:8000")
+# 每个 worker 一个进程，连接池、CAS 会话等资源在 fork 后各自按需创建
+workers = int(os.getenv("server.workers") or multiprocessing.cpu_count())
+# 签到写后批量入库（checkin.write_behind=1）依赖进程内的已签到集合判重，只能单 worker 运行
+if os.getenv("checkin.write_behind", "0") == "1":
+    workers = 1
+# 签到推送（SSE）与留言板长轮询会长时间占用线程，使用线程型 worker
+worker_class = "gthread"
+threads = int(os.getenv("server.threads", 16))
+# 在 master 中导入应用后再 fork，worker 共享只读的代码页，启动更快
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # 清空上次运行留下的各 worker 指标快照
+    import metrics
+    metrics.clear_dir()
+    import db_pool
+    if db_pool.pool_size() < threads:
+        server.log.warning("db.pool_size=%d 小于 server.threads=%d，并发请求可能等待连接超时",
+                           db_pool.pool_size(), threads)
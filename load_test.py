@@ -0,0 +1,356 @@
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+import db_pool
+
+# 压测数据：学号 <prefix>0001 起，管理员 <prefix>admin，用户组 <prefix>role
+ADMIN_PASSWORD = "loadtest"
+
+
+class Recorder:
+    # 记录每个请求的耗时与成败，按场景、接口汇总
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, scenario, name, latency, ok):
+        with self._lock:
+            self._samples.setdefault(scenario, {}).setdefault(name, []).append((latency, ok))
+
+    def summary(self, scenario, duration):
+        endpoints = {}
+        for name, samples in sorted(self._samples.get(scenario, {}).items()):
+            latencies = sorted(latency for latency, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            endpoints[name] = {
+                'count': len(samples),
+                'errors': errors,
+                'error_rate': round(errors / len(samples), 4),
+                'throughput_rps': round(len(samples) / duration, 2) if duration else None,
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'max_ms': round(latencies[-1] * 1000, 2),
+            }
+        return {'duration_s': round(duration, 3), 'endpoints': endpoints}
+
+
+def percentile(sorted_values, p):
+    # 最近秩法
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return round(sorted_values[int(rank) - 1] * 1000, 2)
+
+
+class Client:
+    # 每个线程一个 requests.Session；cookies 为登录后的会话
+
+    def __init__(self, base_url, recorder, cookies=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.cookies = cookies
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            if self.cookies:
+                session.cookies.update(self.cookies)
+        return session
+
+    def request(self, scenario, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session().request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            # 读完响应体（下载 ZIP 时计入传输时间）
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response = None
+            ok = False
+        self.recorder.add(scenario, name, time.perf_counter() - start, ok)
+        return response
+
+
+# ---------------- 数据准备 ----------------
+
+def student_uid(prefix, i):
+    return f"{prefix}{i:04d}"
+
+
+def seed(prefix, students):
+    # 学生与管理员 INSERT IGNORE，可重复执行；每次运行新建签到、收集任务
+    conn = db_pool.connect()
+    try:
+        cursor = conn.cursor()
+        admin = f"{prefix}admin"
+        password = hashlib.sha1(ADMIN_PASSWORD.encode('utf-8')).hexdigest()
+        cursor.execute("INSERT IGNORE INTO user(uid, name, password, tag, isAdmin) VALUES(%s, %s, %s, %s, 1)",
+                       (admin, "压测管理员", password, "loadtest"))
+        cursor.execute("UPDATE user SET password=%s WHERE uid=%s", (password, admin))
+        uids = [student_uid(prefix, i) for i in range(1, students + 1)]
+        cursor.executemany("INSERT IGNORE INTO user(uid, name, tag, isAdmin) VALUES(%s, %s, %s, 0)",
+                           [(uid, f"压测{uid[len(prefix):]}", "loadtest") for uid in uids])
+        role = f"{prefix}role"
+        cursor.execute("DELETE FROM user_role WHERE role=%s", (role,))
+        # 上一次运行的抽签历史会影响 excludeRecent
+        cursor.execute("DELETE FROM lottery_draw WHERE role=%s", (role,))
+        cursor.executemany("INSERT INTO user_role(uid, role, createdBy) VALUES(%s, %s, %s)",
+                           [(uid, role, admin) for uid in uids])
+        expire = datetime.datetime.now() + datetime.timedelta(hours=1)
+        cursor.execute("INSERT INTO checkin_task(taskName, expireTime, uid) VALUES(%s, %s, %s)",
+                       ("压测签到", expire, admin))
+        checkin_task = cursor.lastrowid
+        cursor.execute("INSERT INTO collect_task(taskName, taskType, expireTime, uid) VALUES(%s, %s, %s, %s)",
+                       ("压测收集", "image", expire, admin))
+        collect_task = cursor.lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+    return {'admin': admin, 'uids': uids, 'role': role,
+            'checkin_task': checkin_task, 'collect_task': collect_task}
+
+
+def cleanup(prefix):
+    # 删除压测产生的全部数据（上传的图片文件保留在 upload/ 下）
+    conn = db_pool.connect()
+    try:
+        cursor = conn.cursor()
+        like = prefix + '%'
+        admin = f"{prefix}admin"
+        cursor.execute("DELETE FROM checkin_record WHERE uid LIKE %s OR taskId IN "
+                       "(SELECT taskId FROM (SELECT taskId FROM checkin_task WHERE uid=%s) t)", (like, admin))
+        cursor.execute("DELETE FROM collect_record WHERE uid LIKE %s OR taskId IN "
+                       "(SELECT taskId FROM (SELECT taskId FROM collect_task WHERE uid=%s) t)", (like, admin))
+        cursor.execute("DELETE FROM checkin_task WHERE uid=%s", (admin,))
+        cursor.execute("DELETE FROM collect_task WHERE uid=%s", (admin,))
+        cursor.execute("DELETE FROM user_role WHERE uid LIKE %s", (like,))
+        cursor.execute("DELETE FROM lottery_draw WHERE role=%s", (f"{prefix}role",))
+        cursor.execute("DELETE FROM log WHERE uid LIKE %s", (like,))
+        cursor.execute("DELETE FROM attendance_summary WHERE uid LIKE %s", (like,))
+        cursor.execute("DELETE FROM user WHERE uid LIKE %s", (like,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def make_png(rnd, size):
+    # 随机像素的 RGB PNG，每张内容不同，不会被内容寻址存储去重
+    side = max(1, int((size / 3) ** 0.5))
+    raw = b"".join(b"\x00" + rnd.randbytes(side * 3) for _ in range(side))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 1))
+            + chunk(b"IEND", b""))
+
+
+def login(base_url, uid):
+    session = requests.Session()
+    response = session.post(base_url.rstrip('/') + '/api/login',
+                            json={'username': uid, 'password': ADMIN_PASSWORD}, timeout=30)
+    if response.status_code != 200:
+        raise SystemExit(f"管理员登录失败：{response.status_code} {response.text}")
+    return session.cookies.get_dict()
+
+
+# ---------------- 场景 ----------------
+
+def run_checkin(args, data, student, admin, rnd):
+    # 在 window 秒内随机时刻发起全部签到，同时有学生轮询任务列表、管理员轮询未签到名单
+    scenario = 'checkin'
+    # 到达时刻与坐标预先由随机种子生成，多次运行的请求序列一致
+    offsets = sorted(rnd.uniform(0, args.window) for _ in data['uids'])
+    locations = [{'lng': 121.4 + rnd.uniform(-1e-3, 1e-3), 'lat': 31.16 + rnd.uniform(-1e-3, 1e-3),
+                  'address': "压测"} for _ in data['uids']]
+    done = threading.Event()
+    start = time.monotonic()
+
+    def checkin(uid, offset, location):
+        delay = start + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        student.request(scenario, 'POST /api/checkin/do', 'POST', '/api/checkin/do',
+                        json={'taskId': data['checkin_task'], 'uid': uid, 'location': location})
+
+    def poll(client, name, path, interval):
+        while not done.is_set():
+            client.request(scenario, name, 'GET', path)
+            done.wait(interval)
+
+    pollers = [threading.Thread(target=poll, daemon=True,
+                                args=(student, 'GET /api/checkin/task', '/api/checkin/task?getValid=1',
+                                      args.poll_interval))
+               for _ in range(args.pollers)]
+    pollers.append(threading.Thread(target=poll, daemon=True,
+                                    args=(admin, 'GET /api/checkin/list',
+                                          f"/api/checkin/list?taskId={data['checkin_task']}", 1.0)))
+    for thread in pollers:
+        thread.start()
+    with ThreadPoolExecutor(args.workers) as pool:
+        list(pool.map(checkin, data['uids'], offsets, locations))
+    done.set()
+    for thread in pollers:
+        thread.join()
+    return scenario, time.monotonic() - start
+
+
+def run_upload(args, data, student, admin, rnd):
+    # 上传图片并提交到收集任务，然后下载打包结果两次（首次生成、再次命中缓存）
+    scenario = 'upload'
+    uids = data['uids'][:args.uploads]
+    images = [make_png(rnd, args.image_kb * 1024) for _ in uids]
+    start = time.monotonic()
+
+    def submit(uid, image):
+        response = student.request(scenario, 'POST /api/upload', 'POST', '/api/upload',
+                                   files={'file': (f'{uid}.png', image, 'image/png')})
+        if response is None or response.status_code != 200:
+            return
+        value = response.json()['data']['value']
+        student.request(scenario, 'POST /api/collect/do', 'POST', '/api/collect/do',
+                        json={'taskId': data['collect_task'], 'uid': uid, 'taskType': 'image', 'image': value})
+
+    with ThreadPoolExecutor(args.workers) as pool:
+        list(pool.map(submit, uids, images))
+    for name in ('GET /api/collect/download (cold)', 'GET /api/collect/download (cached)'):
+        admin.request(scenario, name, 'GET', f"/api/collect/download?taskId={data['collect_task']}")
+    return scenario, time.monotonic() - start
+
+
+def run_lottery(args, data, student, admin, rnd):
+    scenario = 'lottery'
+    start = time.monotonic()
+
+    def draw(i):
+        admin.request(scenario, 'POST /api/lottery/do', 'POST', '/api/lottery/do',
+                      json={'select': data['role'], 'num': 5, 'seed': i})
+
+    with ThreadPoolExecutor(args.lottery_concurrency) as pool:
+        list(pool.map(draw, range(args.lottery_requests)))
+    return scenario, time.monotonic() - start
+
+
+SCENARIOS = {
+    'checkin': run_checkin,
+    'upload': run_upload,
+    'lottery': run_lottery,
+}
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url.rstrip('/') + '/api', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{base_url} 在 {timeout} 秒内未就绪")
+
+
+def compare(report, baseline):
+    # 与基线逐个接口比较 p95 与吞吐量
+    for scenario, result in report['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(scenario, {}).get('endpoints', {})
+        for name, stats in result['endpoints'].items():
+            if name not in old:
+                continue
+            before = old[name]
+            print(f"{scenario:<8} {name:<36} p95 {before['p95_ms']:>8} -> {stats['p95_ms']:>8} ms  "
+                  f"错误率 {before['error_rate']:.2%} -> {stats['error_rate']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟班级集中签到的压测")
+    parser.add_argument('--url', default="http://127.0.0.1:8000", help="被测服务地址")
+    parser.add_argument('--spawn', help="启动被测服务的命令，例如 'gunicorn -c gunicorn.conf.py wsgi:app'")
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="逗号分隔：checkin,upload,lottery")
+    parser.add_argument('--prefix', default="lt", help="压测学号前缀")
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--window', type=float, default=30, help="签到集中在多少秒内完成")
+    parser.add_argument('--workers', type=int, default=64, help="并发请求线程数")
+    parser.add_argument('--pollers', type=int, default=30, help="轮询任务列表的学生数")
+    parser.add_argument('--poll-interval', type=float, default=2)
+    parser.add_argument('--uploads', type=int, default=60)
+    parser.add_argument('--image-kb', type=int, default=200)
+    parser.add_argument('--lottery-requests', type=int, default=200)
+    parser.add_argument('--lottery-concurrency', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=20231206)
+    parser.add_argument('--json', help="结果写入该文件（默认输出到标准输出）")
+    parser.add_argument('--compare', help="与之前保存的结果比较")
+    parser.add_argument('--cleanup', action='store_true', help="只删除压测数据后退出")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.cleanup:
+        cleanup(args.prefix)
+        print("已删除压测数据")
+        return 0
+    names = [name for name in args.scenarios.split(',') if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景：{', '.join(sorted(unknown))}")
+
+    server = subprocess.Popen(args.spawn, shell=True) if args.spawn else None
+    try:
+        wait_ready(args.url, 30)
+        data = seed(args.prefix, args.students)
+        recorder = Recorder()
+        student = Client(args.url, recorder)
+        admin = Client(args.url, recorder, cookies=login(args.url, data['admin']))
+        rnd = random.Random(args.seed)
+        report = {
+            'meta': {
+                'url': args.url,
+                'spawn': args.spawn,
+                'started': datetime.datetime.now().isoformat(timespec='seconds'),
+                'params': {k: v for k, v in vars(args).items() if k not in ('json', 'compare', 'cleanup')},
+            },
+            'scenarios': {},
+        }
+        for name in names:
+            scenario, duration = SCENARIOS[name](args, data, student, admin, rnd)
+            report['scenarios'][scenario] = recorder.summary(scenario, duration)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    output = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+    failed = sum(stats['errors'] for result in report['scenarios'].values()
+                 for stats in result['endpoints'].values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import json
+import os
+import random
+import threading
+import time
+
+from db_pool import connection
+
+ALL = '全体'
+
+
+class LotteryEngine:
+    # 在内存中维护 用户组 -> 成员 列表，按 TTL 或显式失效刷新；
+    # 抽签结果记入 lottery_draw 表，excludeRecent 按表中记录排除，各 worker 共享
+
+    def __init__(self, ttl=None, history=None):
+        self.ttl = ttl or float(os.getenv("lottery.ttl", 300))
+        self.history_size = history or int(os.getenv("lottery.history", 20))
+        self._members = None
+        self._roles = []
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT uid, name FROM user ORDER BY uid")
+            users = cursor.fetchall()
+            cursor.execute("SELECT r.role, u.uid, u.name FROM user_role r "
+                           "JOIN user u ON r.uid = u.uid ORDER BY r.role, u.uid")
+            role_rows = cursor.fetchall()
+        members = {ALL: users}
+        for role, uid, name in role_rows:
+            members.setdefault(role, []).append((uid, name))
+        return members
+
+    def invalidate(self):
+        with self._lock:
+            self._members = None
+
+    def members(self):
+        members = self._members
+        if members is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return members
+        members = self._load()
+        with self._lock:
+            self._members = members
+            self._roles = [role for role in members if role != ALL]
+            self._loaded_at = time.monotonic()
+        return members
+
+    def roles(self):
+        self.members()
+        return list(self._roles)
+
+    def draw(self, role, num=1, seed=None, exclude_recent=0):
+        # seed 为空时使用 SystemRandom；给定 seed 时对同一名单结果可复现，便于核查。
+        # exclude_recent：排除该用户组最近 n 次抽签中抽中的成员
+        population = self.members().get(role)
+        if population is None:
+            return None
+        exclude_recent = min(max(exclude_recent, 0), self.history_size)
+        with connection() as conn:
+            cursor = conn.cursor()
+            recent = set()
+            if exclude_recent:
+                cursor.execute("SELECT winners FROM lottery_draw WHERE role=%s ORDER BY id DESC LIMIT %s",
+                               (role, exclude_recent))
+                for (winners,) in cursor.fetchall():
+                    recent.update(json.loads(winners))
+            candidates = [m for m in population if m[0] not in recent]
+            rng = random.Random(seed) if seed is not None else random.SystemRandom()
+            winners = rng.sample(candidates, min(max(num, 0), len(candidates)))
+            cursor.execute("INSERT INTO lottery_draw(role, winners) VALUES(%s, %s)",
+                           (role, json.dumps([uid for uid, _ in winners])))
+            conn.commit()
+        return winners
+
+
+engine = LotteryEngine()
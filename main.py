@@ -1,41 +1,45 @@
-import io
-import zipfile
-from flask import Flask, request, jsonify, render_template, redirect, send_from_directory, send_file
+from flask import Blueprint, Flask, Response, request, jsonify, render_template, redirect, send_file
 from flask_login import LoginManager, UserMixin, login_user, login_required, current_user
-
-import requests
-from bs4 import BeautifulSoup
+from werkzeug.security import safe_join
 
 import os
 from dotenv import load_dotenv
-import mysql.connector
+
+# 各模块在导入时读取配置，先加载 .env
+load_dotenv()
+
 import datetime
-import uuid
+import mysql.connector
 
-from des_util import raw_str_enc
+import attendance_export
+import attendance_stream
+import attendance_summary
+import audit_log
+import bbs_board
+import checkin_ingest
+import geofence
+import lottery
+import metrics
+import db_pool
+from db_pool import get_db
+from paging import PAGED_LISTS, query_page
+import task_cache
+import user_directory
+from static_files import send_static, accel_mode
+from thumbnails import ThumbnailService
+from upload_store import UploadStore, UploadError, max_size
+import zip_stream
 import hashlib
 
-load_dotenv()
-
-app = Flask(__name__, static_url_path='/', static_folder='static')
-app.secret_key = os.getenv("secret.key")
+# 数据库连接池、CAS 会话、缩略图进程池、批量写入线程都在各进程首次使用时创建，
+# 这里只构造不持有连接的对象，gunicorn --preload 在 fork 前导入也是安全的
+bp = Blueprint('main', __name__)
 
 root_pwd = os.getenv("root_pwd")
 env = os.getenv("env")
-
-
-@app.route('/upload/<path:filename>')
-def download_file(filename):
-    return send_from_directory("upload", filename)
-
-
-# 连接数据库
-db = mysql.connector.connect(
-    host=os.getenv("db.host"),
-    user=os.getenv("db.user"),
-    password=os.getenv("db.password"),
-    database=os.getenv("db.database")
-)
+upload_store = UploadStore((root_pwd or '') + 'upload')
+thumbnails = ThumbnailService(upload_store.root)
+zip_cache = zip_stream.ZipCache((root_pwd or '') + os.path.join('upload', '.zipcache'))
 
 
 class User(UserMixin):
@@ -44,20 +48,48 @@ class User(UserMixin):
 
 
 login_manager = LoginManager()
-login_manager.init_app(app)
+
+
+def create_app():
+    app = Flask(__name__, static_url_path='/', static_folder='static')
+    app.secret_key = os.getenv("secret.key")
+    # 按 Content-Length 在读取请求体之前拒绝过大的上传（留出 multipart 头部的余量）
+    app.config['MAX_CONTENT_LENGTH'] = max_size() + 64 * 1024
+    app.config['USE_X_SENDFILE'] = accel_mode() == 'sendfile'
+    # 连接数据库（连接池，每个请求取用一个连接）
+    db_pool.init_app(app)
+    metrics.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+
+@bp.route('/upload/<path:filename>')
+def download_file(filename):
+    # .derived/.zipcache/.tmp 等内部目录不直接对外提供
+    if any(part.startswith('.') for part in filename.split('/')):
+        return jsonify({'msg': '文件不存在'}), 404
+    size = request.args.get('size')
+    if size and safe_join(upload_store.root, filename):
+        derived = thumbnails.get(filename, size)
+        if derived:
+            relative = os.path.relpath(derived, upload_store.root).replace(os.sep, '/')
+            return send_static(upload_store.root, relative)
+        # 缩略图暂不可用：重定向到原图地址，不能把原图以长期缓存的头部挂在 ?size= 地址下
+        return redirect(request.path)
+    return send_static(upload_store.root, filename)
 
 
 def log(uid, info):
-    time = datetime.datetime.now()
-    log_cursor = db.cursor()
-    log_cursor.execute("INSERT INTO log(uid, info, time) "
-                       "VALUES(%s, %s, %s)",
-                       (uid, info, time,))
-    db.commit()
+    # 异步批量写入，见 audit_log.py
+    audit_log.write(uid, info)
 
 
 @login_manager.user_loader
 def load_user(user_id):
+    # 从内存中的用户目录校验会话中的学号，已删除的用户会话随之失效
+    if user_directory.directory.get(user_id) is None:
+        return None
     return User(user_id)
 
 
@@ -66,46 +98,41 @@ def unauthorized():
     return redirect('/login')
 
 
-@app.route('/')
+@bp.route('/')
 def page_index():
     return render_template('index.html', env = env)
 
 
-@app.route('/login')
+@bp.route('/login')
 def page_login():
     if current_user.is_authenticated:
         return redirect('/admin')
     return render_template('login.html')
 
 
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def page_admin():
     return render_template('admin.html')
 
 
-@app.route('/api')
+@bp.route('/api')
 def api_index():
     return jsonify({'production': env,
                     'author': 'Hong Yuxuan', 'environment': 'prod'})
 
 
-@app.route('/api/user')
+@bp.route('/api/user')
 def api_user():
-    cursor = db.cursor()
-    query = "SELECT name FROM user WHERE uid=%s"
-    cursor.execute(query, (f'{current_user.id}',))
-    user = cursor.fetchone()
-    return jsonify({'user': f'{user[0]}'})
+    return jsonify({'user': f'{user_directory.directory.name(current_user.id)}'})
 
 
 # 登陆
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def api_login():
-    session = requests.session()
     username = request.json.get('username')
     password = request.json.get('password')
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     query = "SELECT * FROM user WHERE uid=%s AND isAdmin=1"
     cursor.execute(query, (username,))
     user = cursor.fetchone()
@@ -115,7 +142,7 @@ def api_login():
     password_.update(password.encode('utf-8'))
     password_enc = password_.hexdigest()
     # 优先比较数据库
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     query = "SELECT * FROM user WHERE uid=%s AND password=%s"
     cursor.execute(query, (username, password_enc,))
     login = cursor.fetchone()
@@ -124,37 +151,18 @@ def api_login():
         login_user(user)
         log(username, "成功登录")
         return jsonify({'msg': '登录成功'})
-    # 接入校园网登录模块
-    login_url = "https://cas.shnu.edu.cn/cas/login?service=http%3A%2F%2Fcourse.shnu.edu.cn%2Feams%2Flogin.action"
-    response = session.get(login_url)
-    if 'id="lt"' in response.text:
-        soup = BeautifulSoup(response.text, "html.parser")
-        lt_value = soup.find("input", {"id": "lt"})["value"]
-    else:
-        lt_value = ''
-    if 'name="execution"' in response.text:
-        execution = soup.find("input", {"name": "execution"})["value"]
-    else:
-        execution = "e1s1"
-    data = {
-        "rsa": raw_str_enc(username + password + lt_value),
-        "ul": len(username),
-        "pl": len(password),
-        "lt": lt_value,
-        "execution": execution,
-        "_eventId": "submit",
-    }
-    post_headers = {
-        "content-type": "application/x-www-form-urlencoded",
-        "referer": login_url,
-    }
-    response = session.post(login_url, data=data, headers=post_headers)
-    if "我的账户" not in response.text:
+    # 接入校园网登录模块；requests 等依赖较重，首次走 CAS 时才导入
+    from cas_client import cas_login, CasUnavailable
+    try:
+        cas_ok = cas_login(username, password)
+    except CasUnavailable:
+        return jsonify({'msg': '统一身份认证服务暂不可用，请稍后再试'}), 503
+    if not cas_ok:
         return jsonify({'msg': '用户名或密码错误'}), 401
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     query = "UPDATE user SET password=%s WHERE uid=%s"
     cursor.execute(query, (password_enc, username,))
-    db.commit()
+    get_db().commit()
     user = User(username)
     login_user(user)
     log(username, "成功登录")
@@ -162,25 +170,38 @@ def api_login():
 
 
 # 添加签到任务
-@app.route('/api/checkin/create', methods=['POST'])
+@bp.route('/api/checkin/create', methods=['POST'])
 @login_required
 def api_checkin_create():
     task_name = request.json.get('taskName')
     expire_time = request.json.get('expireTime')
     uid = current_user.id
+    # 可选的签到范围：中心点经纬度与半径（米），三者同时提供才生效
+    fence = [request.json.get(k) for k in ('centerLng', 'centerLat', 'radius')]
+    if any(v is not None for v in fence):
+        try:
+            fence = [float(v) for v in fence]
+        except (TypeError, ValueError):
+            return jsonify({'msg': '签到范围不完整！'}), 404
+        if fence[2] <= 0:
+            return jsonify({'msg': '签到范围不完整！'}), 404
+    else:
+        fence = [None, None, None]
     # 参数校验
     expire_time_formatted = datetime.datetime.now() + datetime.timedelta(minutes=expire_time)
     formatted_date = expire_time_formatted.strftime("%Y-%m-%d %H:%M:%S")
-    cursor = db.cursor()
-    cursor.execute("INSERT INTO checkin_task(taskName, expireTime, uid) VALUES(%s, %s, %s)",
-                   (task_name, formatted_date, uid,))
-    db.commit()
+    cursor = get_db().cursor()
+    cursor.execute("INSERT INTO checkin_task(taskName, expireTime, uid, centerLng, centerLat, radius) "
+                   "VALUES(%s, %s, %s, %s, %s, %s)",
+                   (task_name, formatted_date, uid, *fence))
+    task_cache.cache.invalidate('checkin', cursor)
+    get_db().commit()
     log(current_user.id, f"创建{task_name}签到任务，过期时间为{formatted_date}")
     return jsonify({'msg': '创建成功'})
 
 
 # 签到
-@app.route('/api/checkin/do', methods=['POST'])
+@bp.route('/api/checkin/do', methods=['POST'])
 def api_checkin_do():
     task_id = request.json.get('taskId')
     uid = request.json.get('uid')
@@ -191,24 +212,45 @@ def api_checkin_do():
         return jsonify({'msg': '无法获取位置信息！'}), 404
     if not uid or not task_id:
         return jsonify({'msg': '数据不完整！'}), 404
-    do_cursor = db.cursor()
+    time = datetime.datetime.now()
+    if checkin_ingest.enabled():
+        try:
+            status = checkin_ingest.ingest.submit(task_id, uid, longitude, latitude, time, address)
+        except ValueError:
+            return jsonify({'msg': '数据不完整！'}), 404
+        if status == checkin_ingest.DUPLICATE:
+            return jsonify({'msg': '请勿重复签到！'}), 404
+        if status == checkin_ingest.NO_TASK:
+            return jsonify({'msg': '任务不存在'}), 404
+        if status == checkin_ingest.NO_USER:
+            return jsonify({'msg': '用户不存在'}), 404
+        attendance_stream.hub.mark(task_id, uid, 'checkin')
+        geofence.scorer.add(task_id, uid, longitude, latitude)
+        log(uid, f"进行{task_id}签到")
+        return jsonify({'msg': '签到成功'})
+    do_cursor = get_db().cursor()
     query = "SELECT * FROM checkin_record WHERE uid=%s AND taskId=%s"
     do_cursor.execute(query, (uid, task_id,))
     user = do_cursor.fetchall()
     if user:
         return jsonify({'msg': '请勿重复签到！'}), 404
-    time = datetime.datetime.now()
-    in_cursor = db.cursor()
-    in_cursor.execute("INSERT INTO checkin_record(taskId, uid, longitude, latitude, time, note) "
-                      "VALUES(%s, %s, %s, %s, %s, %s)",
-                      (task_id, uid, longitude, latitude, time, address,))
-    db.commit()
+    in_cursor = get_db().cursor()
+    try:
+        in_cursor.execute("INSERT INTO checkin_record(taskId, uid, longitude, latitude, time, note) "
+                          "VALUES(%s, %s, %s, %s, %s, %s)",
+                          (task_id, uid, longitude, latitude, time, address,))
+    except mysql.connector.IntegrityError:
+        return jsonify({'msg': '请勿重复签到！'}), 404
+    attendance_summary.record_checkin(in_cursor, task_id, uid, time)
+    get_db().commit()
+    attendance_stream.hub.mark(task_id, uid, 'checkin')
+    geofence.scorer.add(task_id, uid, longitude, latitude)
     log(uid, f"进行{task_id}签到")
     return jsonify({'msg': '签到成功'})
 
 
 # 请假
-@app.route('/api/checkin/leave', methods=['POST'])
+@bp.route('/api/checkin/leave', methods=['POST'])
 @login_required
 def api_checkin_leave():
     task_id = request.json.get('taskId')
@@ -216,56 +258,62 @@ def api_checkin_leave():
     time = datetime.datetime.now()
     if not uid or not task_id:
         return jsonify({'msg': '数据不完整！'}), 404
-    cursor = db.cursor()
-    query = "SELECT name FROM user WHERE uid=%s"
-    cursor.execute(query, (current_user.id,))
-    task = cursor.fetchone()
-    note = f"由{task[0]}请假"
-    cursor.execute("INSERT INTO checkin_record(taskId, uid, time, note) VALUES(%s, %s, %s, %s)",
-                   (task_id, uid, time, note,))
-    db.commit()
+    note = f"由{user_directory.directory.name(current_user.id)}请假"
+    if checkin_ingest.enabled():
+        try:
+            status = checkin_ingest.ingest.claim(task_id, uid)
+        except ValueError:
+            return jsonify({'msg': '数据不完整！'}), 404
+        if status == checkin_ingest.DUPLICATE:
+            return jsonify({'msg': '该同学已签到或已请假！'}), 404
+        if status == checkin_ingest.NO_TASK:
+            return jsonify({'msg': '任务不存在'}), 404
+        if status == checkin_ingest.NO_USER:
+            return jsonify({'msg': '用户不存在'}), 404
+    cursor = get_db().cursor()
+    try:
+        cursor.execute("INSERT INTO checkin_record(taskId, uid, time, note) VALUES(%s, %s, %s, %s)",
+                       (task_id, uid, time, note,))
+    except mysql.connector.IntegrityError:
+        if checkin_ingest.enabled():
+            checkin_ingest.ingest.release(task_id, uid)
+        return jsonify({'msg': '该同学已签到或已请假！'}), 404
+    attendance_summary.record_leave(cursor, task_id, uid)
+    get_db().commit()
+    attendance_stream.hub.mark(task_id, uid, 'leave')
     log(current_user.id, f"在{task_id}任务中，为{uid}请假")
     return jsonify({'msg': '请假成功'})
 
 
 # 查看签到任务表
-@app.route('/api/checkin/task', methods=['GET'])
+@bp.route('/api/checkin/task', methods=['GET'])
 def api_checkin_task():
-    list_cursor = db.cursor()
-    query = """SELECT t.taskId, t.taskName, t.expireTime, u.name  
-         FROM checkin_task t 
-         JOIN user u ON t.uid = u.uid
-         ORDER BY t.taskId DESC"""
-    list_cursor.execute(query, ())
-    tasks = list_cursor.fetchall()
-    if tasks is None:
-        return jsonify({'msg': '无任务'}), 404
+    return task_cache.cache.serve('checkin', _checkin_task_page, _checkin_valid_until)
+
+
+def _checkin_valid_until():
+    cursor = get_db().cursor()
+    cursor.execute("SELECT MIN(expireTime) FROM checkin_task WHERE expireTime >= %s",
+                   (datetime.datetime.now(),))
+    return cursor.fetchone()[0]
+
+
+def _checkin_task_page():
+    paged = PAGED_LISTS['checkin_task']
+    where, params = list(paged.where), []
     if request.args.get('getValid'):
-        valid_tasks = []
-        for task in tasks:
-            if task[2] >= datetime.datetime.now():
-                valid_tasks.append(task)
-        if valid_tasks is None:
-            return jsonify({'msg': '无有效任务'}), 404
-        column_names = [description[0] for description in list_cursor.description]
-        data = {
-            'items': [dict(zip(column_names, row)) for row in valid_tasks]
-        }
-        return jsonify(data)
-    else:
-        column_names = [description[0] for description in list_cursor.description]
-        data = {
-            'items': [dict(zip(column_names, row)) for row in tasks]
-        }
-        return jsonify(data)
+        where.append(paged.valid_filter)
+        params.append(datetime.datetime.now())
+    return query_page(get_db().cursor(), paged.columns, paged.from_clause,
+                      where, params, key=paged.key, descending=paged.descending)
 
 
 # 查看未签到名单
-@app.route('/api/checkin/list', methods=['GET'])
+@bp.route('/api/checkin/list', methods=['GET'])
 @login_required
 def api_checkin_list():
     task_id = request.args.get('taskId')
-    cursor = db.cursor()
+    cursor = get_db().cursor()
 
     query = "SELECT * FROM checkin_task WHERE taskId=%s"
     cursor.execute(query, (task_id,))
@@ -287,34 +335,90 @@ def api_checkin_list():
     return jsonify(data)
 
 
+# 未签到名单实时推送（SSE）
+@bp.route('/api/checkin/stream', methods=['GET'])
+@login_required
+def api_checkin_stream():
+    task_id = request.args.get('taskId')
+    if not task_id or not attendance_stream.hub.task_exists(task_id):
+        return jsonify({'msg': '任务不存在'}), 404
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    }
+    return Response(attendance_stream.hub.stream(task_id), mimetype='text/event-stream', headers=headers)
+
+
+# 考勤统计
+@bp.route('/api/checkin/stats', methods=['GET'])
+@login_required
+def api_checkin_stats():
+    # 先结算已过期的任务，再读取汇总表
+    attendance_summary.close_expired(get_db())
+    items = attendance_summary.stats(get_db(), request.args.get('uid'))
+    return jsonify({'items': items})
+
+
+# 考勤汇总导出（学生 × 签到任务）
+@bp.route('/api/checkin/export', methods=['GET'])
+@login_required
+def api_checkin_export():
+    export_format = request.args.get('format', 'csv')
+    role = request.args.get('role') or None
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    try:
+        if start:
+            start = datetime.datetime.strptime(start, "%Y-%m-%d")
+        if end:
+            end = datetime.datetime.strptime(end, "%Y-%m-%d") + datetime.timedelta(days=1)
+    except ValueError:
+        return jsonify({'msg': '日期格式应为 YYYY-MM-DD'}), 404
+    tasks = attendance_export.load_tasks(start, end)
+    log(current_user.id, f"导出考勤汇总，共{len(tasks)}个签到任务")
+    if export_format == 'xlsx':
+        if not attendance_export.xlsx_available():
+            return jsonify({'msg': '服务器未安装 openpyxl，无法导出 xlsx'}), 404
+        path = attendance_export.write_xlsx(tasks, role)
+        response = Response(attendance_export.stream_file(path),
+                            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        filename = '考勤汇总.xlsx'
+    else:
+        response = Response(attendance_export.generate_csv(tasks, role), mimetype='text/csv')
+        filename = '考勤汇总.csv'
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    return response
+
+
 # 查看签到记录
-@app.route('/api/checkin/record', methods=['GET'])
+@bp.route('/api/checkin/record', methods=['GET'])
 @login_required
 def api_checkin_record():
     task_id = request.args.get('taskId')
-    cursor = db.cursor()
+    # 先于本请求的其他查询加载打分状态，见 geofence.GeofenceScorer._load
+    flags = geofence.scorer.flags(task_id)
+    cursor = get_db().cursor()
 
     query = "SELECT * FROM checkin_task WHERE taskId=%s"
     cursor.execute(query, (task_id,))
     task = cursor.fetchone()
     if task is None:
         return jsonify({'msg': '任务不存在'}), 404
-    query = """SELECT r.uid, r.longitude, r.latitude, r.time, r.note, u.name
-         FROM checkin_record r 
-         JOIN user u ON r.uid = u.uid
-         WHERE r.taskId=%s"""
-    cursor.execute(query, (task_id,))
-    records = cursor.fetchall()
+    paged = PAGED_LISTS['checkin_record']
 
-    column_names = [description[0] for description in cursor.description]
-    data = {
-        'items': [dict(zip(column_names, row)) for row in records]
-    }
-    return jsonify(data)
+    def add_flags(items):
+        # 范围外、多人坐标完全相同、异常聚集；请假记录没有坐标，不打标记
+        for item in items:
+            item['flags'] = flags.get(item.get('uid'), [])
+
+    # 姓名取自内存中的用户目录，不再 JOIN user
+    return query_page(cursor, paged.columns, paged.from_clause,
+                      paged.where, [task_id], key=paged.key, descending=paged.descending, decorate=add_flags,
+                      derived={'name': ('uid', user_directory.directory.name)})
 
 
 # 添加收集任务
-@app.route('/api/collect/create', methods=['POST'])
+@bp.route('/api/collect/create', methods=['POST'])
 @login_required
 def api_collect_create():
     task_name = request.json.get('taskName')
@@ -323,56 +427,47 @@ def api_collect_create():
     if not task_type or not task_name or not expire_time:
         return jsonify({'msg': '参数不完整'}), 404
     uid = current_user.id
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     cursor.execute("INSERT INTO collect_task(taskName, taskType, expireTime, uid) VALUES(%s, %s, %s, %s)",
                    (task_name, task_type, expire_time, uid,))
-    db.commit()
+    task_cache.cache.invalidate('collect', cursor)
+    get_db().commit()
     log(current_user.id, f"创建{task_name}收集任务，过期时间为{expire_time}")
     return jsonify({'msg': '创建成功'})
 
 
 # 查看收集任务表
-@app.route('/api/collect/task', methods=['GET'])
+@bp.route('/api/collect/task', methods=['GET'])
 def api_collect_task():
     if not request.args.get('taskType'):
         return jsonify({'items': []})
+    return task_cache.cache.serve('collect', _collect_task_page, _collect_valid_until)
+
+
+def _collect_valid_until():
+    cursor = get_db().cursor()
+    cursor.execute("SELECT MIN(expireTime) FROM collect_task WHERE taskType=%s AND expireTime >= %s",
+                   (request.args.get('taskType'), datetime.datetime.now(),))
+    return cursor.fetchone()[0]
+
+
+def _collect_task_page():
     task_type = request.args.get('taskType')
-    cursor = db.cursor()
-    query = """SELECT t.taskId, t.taskName, t.expireTime, t.taskType, u.name  
-         FROM collect_task t 
-         JOIN user u ON t.uid = u.uid
-         WHERE t.taskType=%s
-         ORDER BY t.taskId DESC"""
-    cursor.execute(query, (task_type,))
-    tasks = cursor.fetchall()
-    if tasks is None:
-        return jsonify({'msg': '无任务'}), 404
+    paged = PAGED_LISTS['collect_task']
+    where, params = list(paged.where), [task_type]
     if request.args.get('getValid'):
-        valid_tasks = []
-        for task in tasks:
-            if task[2] >= datetime.datetime.now():
-                valid_tasks.append(task)
-        if valid_tasks is None:
-            return jsonify({'msg': '无有效任务'}), 404
-        column_names = [description[0] for description in cursor.description]
-        data = {
-            'items': [dict(zip(column_names, row)) for row in valid_tasks]
-        }
-        return jsonify(data)
-    else:
-        column_names = [description[0] for description in cursor.description]
-        data = {
-            'items': [dict(zip(column_names, row)) for row in tasks]
-        }
-        return jsonify(data)
+        where.append(paged.valid_filter)
+        params.append(datetime.datetime.now())
+    return query_page(get_db().cursor(), paged.columns, paged.from_clause,
+                      where, params, key=paged.key, descending=paged.descending)
 
 
 # 查看未提交名单
-@app.route('/api/collect/list', methods=['GET'])
+@bp.route('/api/collect/list', methods=['GET'])
 @login_required
 def api_collect_list():
     task_id = request.args.get('taskId')
-    cursor = db.cursor()
+    cursor = get_db().cursor()
 
     query = "SELECT * FROM collect_task WHERE taskId=%s"
     cursor.execute(query, (task_id,))
@@ -395,64 +490,61 @@ def api_collect_list():
 
 
 # 查看提交记录
-@app.route('/api/collect/record', methods=['GET'])
+@bp.route('/api/collect/record', methods=['GET'])
 @login_required
 def api_collect_record():
     task_id = request.args.get('taskId')
-    cursor = db.cursor()
+    cursor = get_db().cursor()
 
     query = "SELECT * FROM collect_task WHERE taskId=%s"
     cursor.execute(query, (task_id,))
     task = cursor.fetchone()
     if task is None:
         return jsonify({'msg': '任务不存在'}), 404
-    query = """SELECT r.uid, r.taskId, r.content, r.time, u.name
-         FROM collect_record r 
-         JOIN user u ON r.uid = u.uid
-         WHERE r.taskId=%s"""
-    cursor.execute(query, (task_id,))
-    records = cursor.fetchall()
-
-    column_names = [description[0] for description in cursor.description]
-    data = {
-        'items': [dict(zip(column_names, row)) for row in records]
-    }
-    return jsonify(data)
+    paged = PAGED_LISTS['collect_record']
+    return query_page(cursor, paged.columns, paged.from_clause,
+                      paged.where, [task_id], key=paged.key, descending=paged.descending,
+                      derived={'name': ('uid', user_directory.directory.name)})
 
 
 # 修改收集任务截止时间
-@app.route('/api/collect/edit', methods=['POST'])
+@bp.route('/api/collect/edit', methods=['POST'])
 @login_required
 def api_collect_edit():
     task_id = request.json.get('taskId')
     expire_time = request.json.get('expireTime')
     if not task_id or not expire_time:
         return jsonify({'msg': '参数不完整'}), 404
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     cursor.execute("UPDATE collect_task SET expireTime=%s WHERE taskId=%s", (expire_time, task_id, ))
-    db.commit()
+    task_cache.cache.invalidate('collect', cursor)
+    get_db().commit()
     log(current_user.id, f"修改{task_id}收集任务截止时间为{expire_time}")
     return jsonify({'msg': '修改成功'})
 
 
 # 图片上传
-@app.route('/api/upload', methods=['POST'])
+@bp.route('/api/upload', methods=['POST'])
 def api_upload():
     image = request.files['file']
-    filename = uuid.uuid4().hex + '.png'
-    image.save(root_pwd + os.path.join('upload', filename))
+    try:
+        relative, created = upload_store.save(image.stream)
+    except UploadError as e:
+        return jsonify({"status": 1, "msg": str(e)}), 400
+    if created:
+        thumbnails.schedule(relative)
     response = {
         "status": 0,
         "msg": "",
         "data": {
-            "value": "upload/" + filename
+            "value": upload_store.url(relative)
         }
     }
     return jsonify(response)
 
 
 # 收集提交
-@app.route('/api/collect/do', methods=['POST'])
+@bp.route('/api/collect/do', methods=['POST'])
 def api_collect_do():
     task_id = request.json.get('taskId')
     uid = request.json.get('uid')
@@ -465,61 +557,73 @@ def api_collect_do():
         content = request.json.get('content')
     if not content:
         return jsonify({'msg': '非法提交！'}), 404
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     query = "SELECT * FROM collect_record WHERE uid=%s AND taskId=%s"
     cursor.execute(query, (uid, task_id,))
     user = cursor.fetchall()
     if user:
         return jsonify({'msg': '请勿重复提交！'}), 404
     time = datetime.datetime.now()
-    cursor = db.cursor()
-    cursor.execute("INSERT INTO collect_record(taskId, uid, content, time) "
-                   "VALUES(%s, %s, %s, %s)",
-                   (task_id, uid, content, time,))
-    db.commit()
+    cursor = get_db().cursor()
+    try:
+        cursor.execute("INSERT INTO collect_record(taskId, uid, content, time) "
+                       "VALUES(%s, %s, %s, %s)",
+                       (task_id, uid, content, time,))
+    except mysql.connector.IntegrityError:
+        return jsonify({'msg': '请勿重复提交！'}), 404
+    get_db().commit()
+    if task_type == "image" and content.startswith('upload/') and safe_join(upload_store.root, content[7:]):
+        thumbnails.schedule(content[7:])
     log(uid, f"进行{task_id}收集提交")
     return jsonify({'msg': '提交成功'})
 
 
 # 图片收集打包下载
-@app.route('/api/collect/download', methods=['GET'])
+@bp.route('/api/collect/download', methods=['GET'])
 @login_required
 def api_collect_download():
     task_id = request.args.get('taskId')
-    cursor = db.cursor()
+    cursor = get_db().cursor()
     query = "SELECT taskName FROM collect_task WHERE taskId=%s"
     cursor.execute(query, (task_id,))
     task = cursor.fetchone()
     if task is None:
         return jsonify({'msg': '任务不存在'}), 404
-    query = """SELECT r.content, u.name  
-               FROM collect_record r
-               JOIN user u ON r.uid = u.uid
-               WHERE r.taskId=%s"""
+    # 记录只增不改，记录数与最大 recordId 即可标识记录集版本
+    query = "SELECT COUNT(*), MAX(recordId) FROM collect_record WHERE taskId=%s"
     cursor.execute(query, (task_id,))
-    records = cursor.fetchall()
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w') as zf:
-        for r in records:
-            path, name = r
-            filename = f'{name}-{path.split("/")[-1]}'  # 构造文件名
-            zf.write(path, filename)
-    memory_file.seek(0)
+    count, max_id = cursor.fetchone()
+    version = f"{count}-{max_id or 0}"
+    etag = f"{task_id}-{version}"
+    download_name = f'{task[0]}收集结果.zip'
     log(current_user.id, f"进行{task_id}收集文件的打包下载")
-    return send_file(memory_file, download_name=f'{task[0]}收集结果.zip',
-                     as_attachment=True)
+    cached = zip_cache.get(task_id, version)
+    if cached:
+        return send_file(cached, download_name=download_name, as_attachment=True,
+                         conditional=True, etag=etag)
+    if request.if_none_match.contains(etag):
+        return Response(status=304)
+    query = """SELECT content, uid, time
+               FROM collect_record
+               WHERE taskId=%s
+               ORDER BY recordId"""
+    cursor.execute(query, (task_id,))
+    name = user_directory.directory.name
+    entries = [(path, f'{name(uid)}-{path.split("/")[-1]}', time)  # 构造文件名
+               for path, uid, time in cursor.fetchall()]
+    stream = zip_cache.tee(task_id, version, zip_stream.generate(entries, root_pwd or ''))
+    stream = metrics.timed_stream(metrics.ZIP_SECONDS, (), stream)
+    response = Response(stream, mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.set_etag(etag)
+    return response
 
 
 # 抽签用户组
-@app.route('/api/lottery/list', methods=['GET'])
+@bp.route('/api/lottery/list', methods=['GET'])
 @login_required
 def api_lottery_list():
-    cursor = db.cursor()
-    query = "SELECT DISTINCT role FROM user_role"
-    cursor.execute(query, ())
-    roles = cursor.fetchall()
-    if roles is None:
-        return jsonify({'msg': '用户组不存在'}), 404
+    roles = lottery.engine.roles()
     data = {
         'status': 0,
         'msg': '',
@@ -533,56 +637,64 @@ def api_lottery_list():
     })
     for role in roles:
         data['data']['options'].append({
-            'label': role[0],
-            'value': role[0]
+            'label': role,
+            'value': role
         })
     return jsonify(data)
 
 
 # 抽签
-@app.route('/api/lottery/do', methods=['POST'])
+@bp.route('/api/lottery/do', methods=['POST'])
 @login_required
 def api_lottery_do():
-    cursor = db.cursor()
     role = request.json.get('select')
     num = request.json.get('num')
+    seed = request.json.get('seed')
+    exclude_recent = request.json.get('excludeRecent') or 0
     if num is None:
         num = 1
-    if role == '全体':
-        query = """SELECT name FROM user ORDER BY RAND() LIMIT %s"""
-        cursor.execute(query, (num,))
-    else:
-        query = """SELECT u.name
-             FROM user_role r
-             JOIN user u ON r.uid = u.uid
-             WHERE role=%s ORDER BY RAND() LIMIT %s"""
-        cursor.execute(query, (role, num,))
-    user = cursor.fetchall()
-    if user is None:
+    try:
+        num = int(num)
+        exclude_recent = int(exclude_recent)
+    except (TypeError, ValueError):
+        return jsonify({'msg': '参数错误'}), 404
+    winners = lottery.engine.draw(role, num, seed=seed, exclude_recent=exclude_recent)
+    if winners is None:
         return jsonify({'msg': '用户不存在'}), 404
-    log(current_user.id, f"进行{role}用户组的抽签，抽签结果为{user}")
+    user = [(name,) for _, name in winners]
+    log(current_user.id, f"进行{role}用户组的抽签，抽签结果为{user}"
+                         + (f"，随机种子为{seed}" if seed is not None else ""))
     return jsonify({'name': user})
 
 
 # 留言板
-@app.route('/api/bbs', methods=['GET', 'POST'])
+@bp.route('/api/bbs', methods=['GET', 'POST'])
 def api_bbs():
-    cursor = db.cursor()
     if request.method == 'POST':
         data = request.json
         content = data.get('content')
-        cursor.execute("INSERT INTO bbs(content) VALUES(%s)",
-                       (content,))
-        db.commit()
+        bbs_board.board.post(content)
         return jsonify({'msg': '提交成功'})
-    cursor.execute("SELECT * FROM bbs ORDER BY id DESC")
-    results = cursor.fetchall()
-    column_names = [description[0] for description in cursor.description]
+    limit = max(1, min(request.args.get('limit', type=int) or bbs_board.board.size, bbs_board.board.size))
+    since_id = request.args.get('since_id', type=int)
+    before_id = request.args.get('before_id', type=int)
+    if since_id is not None:
+        wait = min(request.args.get('wait', 0, type=float), 30)
+        if wait > 0:
+            bbs_board.board.wait(since_id, wait)
+        items = bbs_board.board.since(since_id, limit)
+    elif before_id is not None:
+        items = bbs_board.board.before(before_id, limit)
+    else:
+        items = bbs_board.board.latest(limit)
     data = {
-        'items': [dict(zip(column_names, row)) for row in results]
+        'items': items,
+        'lastId': items[0]['id'] if items else since_id,
+        'nextBefore': items[-1]['id'] if items and since_id is None else None,
     }
     return jsonify(data)
 
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8000)
+    # 开发调试用；生产环境见 README「部署」，使用 gunicorn/waitress 多进程运行 wsgi:app
+    create_app().run(host="0.0.0.0", port=8000)
@@ -0,0 +1,279 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+
+from flask import Response, g, request
+
+logger = logging.getLogger(__name__)
+
+# 单位：秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_histograms = []
+
+
+class Histogram:
+    # 进程内直方图：每组标签一个累计桶数组，observe 只做一次二分查找和加法
+
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _histograms.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # 最后两项为总和与次数，+Inf 桶即次数
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', "请求处理耗时", ('endpoint', 'method', 'status'))
+SQL_SECONDS = Histogram('sql_statement_duration_seconds', "SQL 语句执行耗时（按归一化语句）", ('statement',))
+DES_SECONDS = Histogram('des_encrypt_duration_seconds', "DES 加密耗时", ('function',))
+CAS_SECONDS = Histogram('cas_request_duration_seconds', "CAS 请求耗时", ('step',))
+ZIP_SECONDS = Histogram('zip_build_duration_seconds', "收集文件打包耗时（未命中缓存，流式发送完毕为止）", ())
+
+
+# ---------------- SQL ----------------
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)', re.IGNORECASE)
+_SELECT_LIST = re.compile(r'^SELECT .+? FROM ', re.IGNORECASE)
+_statements = set()
+_statements_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query):
+    # 语句本身已参数化；再合并空白、折叠 IN 列表。分页接口的列由 ?fields= 决定，
+    # 带 AS 别名的列清单统一折叠，避免标签数量随请求参数膨胀
+    query = _WHITESPACE.sub(' ', query).strip()
+    query = _IN_LIST.sub('IN (...)', query)
+    match = _SELECT_LIST.match(query)
+    if match and ' AS ' in match.group(0):
+        query = 'SELECT ... FROM ' + query[match.end():]
+    return query
+
+
+def _statement_label(query):
+    if isinstance(query, (bytes, bytearray)):
+        query = query.decode('utf-8', 'replace')
+    label = normalize_sql(query)
+    if label in _statements:
+        return label
+    with _statements_lock:
+        if len(_statements) >= int(os.getenv("metrics.max_statements") or 200):
+            return 'other'
+        _statements.add(label)
+    return label
+
+
+class TimedCursor:
+    # 游标代理：execute/executemany 计时，其余属性转发给原游标。
+    # 未缓冲游标的取数时间不计入
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, *args, **kwargs)
+        finally:
+            SQL_SECONDS.observe(time.perf_counter() - start, _statement_label(query))
+
+    def executemany(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, *args, **kwargs)
+        finally:
+            SQL_SECONDS.observe(time.perf_counter() - start, _statement_label(query))
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# ---------------- 流式响应 ----------------
+
+def timed_stream(histogram, labels, stream):
+    # 生成器发送完毕（或客户端断开）时记录总耗时
+    start = time.perf_counter()
+    try:
+        yield from stream
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+# ---------------- 多进程汇总 ----------------
+# 设置 metrics.dir 后，各 worker 定期把快照写到 <dir>/<pid>.json，/metrics 汇总目录下所有文件
+
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def metrics_dir():
+    return os.getenv("metrics.dir", "")
+
+
+def _dump():
+    return {h.name: [[list(labels), series] for labels, series in h.snapshot().items()] for h in _histograms}
+
+
+def write_snapshot():
+    directory = metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_dump(), f)
+        os.replace(tmp, os.path.join(directory, f"{os.getpid()}.json"))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _run_writer(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot()
+        except OSError:
+            logger.exception("写入指标快照失败")
+
+
+def _ensure_writer():
+    global _writer_pid
+    pid = os.getpid()
+    if _writer_pid == pid or not metrics_dir():
+        return
+    with _writer_lock:
+        if _writer_pid == pid:
+            return
+        interval = float(os.getenv("metrics.flush_interval") or 5)
+        threading.Thread(target=_run_writer, args=(interval,), name='metrics-writer', daemon=True).start()
+        atexit.register(write_snapshot)
+        _writer_pid = pid
+
+
+def clear_dir():
+    # 服务启动时清空上一次运行留下的快照（gunicorn.conf.py 的 on_starting 中调用）
+    directory = metrics_dir()
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def _collect():
+    directory = metrics_dir()
+    if not directory:
+        return {h.name: h.snapshot() for h in _histograms}
+    write_snapshot()
+    merged = {h.name: {} for h in _histograms}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, items in data.items():
+            target = merged.setdefault(name, {})
+            for labels, series in items:
+                labels = tuple(labels)
+                current = target.get(labels)
+                target[labels] = series if current is None else [a + b for a, b in zip(current, series)]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render():
+    # Prometheus 文本格式
+    collected = _collect()
+    lines = []
+    for h in _histograms:
+        lines.append(f"# HELP {h.name} {h.documentation}")
+        lines.append(f"# TYPE {h.name} histogram")
+        for labels, series in sorted(collected.get(h.name, {}).items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(h.labelnames, labels))
+            prefix = base + "," if base else ""
+            cumulative = 0
+            for bound, count in zip(h.buckets, series):
+                cumulative += count
+                lines.append(f'{h.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{h.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{h.name}_sum{suffix} {series[-2]}")
+            lines.append(f"{h.name}_count{suffix} {series[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Flask ----------------
+
+def _before_request():
+    _ensure_writer()
+    g.metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(response.status_code))
+    threshold = float(os.getenv("metrics.slow_request_ms") or 0)
+    if threshold and elapsed * 1000 >= threshold:
+        logger.warning("慢请求 %s %s -> %s，耗时 %.1f ms", request.method, request.full_path.rstrip('?'),
+                       response.status_code, elapsed * 1000)
+    return response
+
+
+def view():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    # 所有路由记录耗时；/metrics 建议只对内网或监控系统开放（见 README）
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', view)
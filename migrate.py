@@ -0,0 +1,286 @@
+import argparse
+import ast
+import datetime
+import os
+import re
+import sys
+
+from dotenv import load_dotenv
+
+import db_pool
+import paging
+
+SQL_START = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE)\s', re.IGNORECASE)
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 迁移、压测脚本不属于服务运行时；metrics.py 中只有归一化后的语句标签。不从这些文件提取 SQL
+EXCLUDED_SOURCES = {'migrate.py', 'load_test.py', 'metrics.py'}
+
+
+class Migration:
+    # 每个迁移需能判断自身是否已生效（applied），以便在已有部署上重复执行、校验
+
+    def __init__(self, version, name):
+        self.version = version
+        self.name = name
+
+    def applied(self, cursor):
+        raise NotImplementedError
+
+    def check(self, cursor):
+        # 执行前的检查，返回错误信息列表
+        return []
+
+    def apply(self, cursor):
+        raise NotImplementedError
+
+
+class AddIndex(Migration):
+
+    def __init__(self, version, table, index, columns, unique=False):
+        super().__init__(version, f"{'unique ' if unique else ''}index {index} on {table}({', '.join(columns)})")
+        self.table = table
+        self.index = index
+        self.columns = columns
+        self.unique = unique
+
+    def applied(self, cursor):
+        cursor.execute("SELECT COLUMN_NAME FROM information_schema.STATISTICS "
+                       "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s "
+                       "ORDER BY SEQ_IN_INDEX", (self.table, self.index))
+        return [row[0] for row in cursor.fetchall()] == list(self.columns)
+
+    def check(self, cursor):
+        if not self.unique:
+            return []
+        columns = ', '.join(f'`{c}`' for c in self.columns)
+        cursor.execute(f"SELECT {columns}, COUNT(*) FROM `{self.table}` "
+                       f"GROUP BY {columns} HAVING COUNT(*) > 1 LIMIT 10")
+        return [f"{self.table} 中存在重复数据 {row[:-1]}（{row[-1]} 条），请先清理"
+                for row in cursor.fetchall()]
+
+    def apply(self, cursor):
+        columns = ', '.join(f'`{c}`' for c in self.columns)
+        kind = 'UNIQUE INDEX' if self.unique else 'INDEX'
+        cursor.execute(f"ALTER TABLE `{self.table}` ADD {kind} `{self.index}` ({columns})")
+
+
+class AddColumn(Migration):
+
+    def __init__(self, version, table, column, definition):
+        super().__init__(version, f"column {table}.{column}")
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def applied(self, cursor):
+        cursor.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND COLUMN_NAME=%s",
+                       (self.table, self.column))
+        return cursor.fetchone() is not None
+
+    def apply(self, cursor):
+        cursor.execute(f"ALTER TABLE `{self.table}` ADD COLUMN `{self.column}` {self.definition}")
+
+
+class CreateTable(Migration):
+
+    def __init__(self, version, table, ddl):
+        super().__init__(version, f"table {table}")
+        self.table = table
+        self.ddl = ddl
+
+    def applied(self, cursor):
+        cursor.execute("SELECT TABLE_NAME FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s", (self.table,))
+        return cursor.fetchone() is not None
+
+    def apply(self, cursor):
+        cursor.execute(self.ddl)
+
+
+MIGRATIONS = [
+    AddIndex(1, 'checkin_record', 'uk_checkin_record_task_uid', ['taskId', 'uid'], unique=True),
+    AddIndex(2, 'collect_record', 'uk_collect_record_task_uid', ['taskId', 'uid'], unique=True),
+    AddIndex(3, 'collect_task', 'idx_collect_task_type_id', ['taskType', 'taskId']),
+    AddIndex(4, 'user_role', 'idx_user_role_role', ['role']),
+    AddIndex(5, 'log', 'idx_log_time', ['time']),
+    AddColumn(6, 'checkin_task', 'summarized', "TINYINT NOT NULL DEFAULT 0"),
+    CreateTable(7, 'attendance_summary', """CREATE TABLE `attendance_summary` (
+      `uid` VARCHAR(20) PRIMARY KEY,
+      `eligible` INT NOT NULL DEFAULT 0,
+      `checkedIn` INT NOT NULL DEFAULT 0,
+      `onLeave` INT NOT NULL DEFAULT 0,
+      `absent` INT NOT NULL DEFAULT 0,
+      `lastCheckin` DATETIME,
+      FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
+    )"""),
+    AddColumn(8, 'checkin_task', 'centerLng', "DOUBLE"),
+    AddColumn(9, 'checkin_task', 'centerLat', "DOUBLE"),
+    AddColumn(10, 'checkin_task', 'radius', "DOUBLE"),
+    CreateTable(11, 'cache_generation', """CREATE TABLE `cache_generation` (
+      `name` VARCHAR(50) PRIMARY KEY,
+      `generation` BIGINT NOT NULL DEFAULT 0
+    )"""),
+    CreateTable(12, 'lottery_draw', """CREATE TABLE `lottery_draw` (
+      `id` INT AUTO_INCREMENT PRIMARY KEY,
+      `role` VARCHAR(20) NOT NULL,
+      `winners` TEXT NOT NULL,
+      `time` DATETIME DEFAULT CURRENT_TIMESTAMP,
+      KEY `idx_lottery_draw_role_id` (`role`, `id`)
+    )"""),
+]
+
+
+def ensure_version_table(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS `schema_migrations` (
+      `version` INT PRIMARY KEY,
+      `name` VARCHAR(255),
+      `appliedAt` DATETIME
+    )""")
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def status(conn):
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    for m in MIGRATIONS:
+        print(f"{m.version:>4}  {'已执行' if m.version in done else '待执行'}  {m.name}")
+
+
+def apply(conn):
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    for m in MIGRATIONS:
+        if m.version in done:
+            continue
+        if m.applied(cursor):
+            # 新部署的 struc.sql 已包含该变更，只登记版本
+            print(f"{m.version:>4}  已存在，登记  {m.name}")
+        else:
+            errors = m.check(cursor)
+            if errors:
+                for error in errors:
+                    print(f"{m.version:>4}  {error}", file=sys.stderr)
+                return False
+            print(f"{m.version:>4}  执行  {m.name}")
+            m.apply(cursor)
+        cursor.execute("INSERT INTO schema_migrations(version, name, appliedAt) VALUES(%s, %s, %s)",
+                       (m.version, m.name, datetime.datetime.now()))
+        conn.commit()
+    return True
+
+
+def verify(conn):
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    ok = True
+    for m in MIGRATIONS:
+        if m.version not in done:
+            continue
+        if not m.applied(cursor):
+            print(f"{m.version:>4}  已登记但未生效  {m.name}", file=sys.stderr)
+            ok = False
+    print("校验通过" if ok else "校验失败")
+    return ok
+
+
+def default_sources():
+    return sorted(os.path.join(HERE, name) for name in os.listdir(HERE)
+                  if name.endswith('.py') and name not in EXCLUDED_SOURCES)
+
+
+def paged_queries():
+    # 分页语句由 query_page 拼接，源码中没有完整的字符串常量；按各接口的参数生成
+    # 计数、按页码偏移、按 after 游标三种语句
+    # （列、条件取自 paging.PAGED_LISTS，与路由一致；任务列表按 getValid=1 的条件生成）
+    queries = []
+    for paged in paging.PAGED_LISTS.values():
+        where = paged.where + ([paged.valid_filter] if paged.valid_filter else [])
+        columns = paged.columns
+        count_query, offset_query = paging.page_queries(columns, list(columns), paged.from_clause, where,
+                                                        paged.key, paged.descending)
+        _, keyset_query = paging.page_queries(columns, list(columns), paged.from_clause, where,
+                                              paged.key, paged.descending, keyset=True)
+        queries.extend([count_query, offset_query, keyset_query])
+    return queries
+
+
+def extract_queries(paths):
+    # 从源码中取出所有 SQL 字符串常量（相邻字符串已由解析器合并）；
+    # f-string 中的片段不是完整语句，跳过
+    queries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        fragments = {id(value) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for value in node.values}
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in fragments
+                    and SQL_START.match(node.value)):
+                query = ' '.join(node.value.split())
+                if query not in queries:
+                    queries.append(query)
+    return queries
+
+
+def sample_params(query):
+    # LIMIT/OFFSET 后的参数用整数，其余用字符串，保证 EXPLAIN 能走到与线上相同的索引
+    params = []
+    for match in re.finditer(r'(\b(?:LIMIT|OFFSET)\s+)?%s', query, re.IGNORECASE):
+        params.append(1 if match.group(1) else '1')
+    return tuple(params)
+
+
+def explain(conn, paths):
+    cursor = conn.cursor(dictionary=True)
+    for query in extract_queries(paths) + paged_queries():
+        print(f"\n-- {query}")
+        try:
+            cursor.execute("EXPLAIN " + query, sample_params(query))
+            rows = cursor.fetchall()
+        except Exception as err:
+            print(f"   EXPLAIN 失败: {err}")
+            continue
+        for row in rows:
+            print(f"   table={row.get('table')} type={row.get('type')} key={row.get('key')} "
+                  f"rows={row.get('rows')} extra={row.get('Extra')}")
+        conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库结构迁移")
+    parser.add_argument('command', choices=['status', 'apply', 'verify', 'explain'])
+    parser.add_argument('--explain', action='store_true', help="apply 前后打印 EXPLAIN")
+    parser.add_argument('--source', nargs='*', default=default_sources(),
+                        help="从这些源文件中提取 SQL 用于 EXPLAIN，默认为除迁移、压测脚本外的所有模块")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = db_pool.connect()
+    try:
+        ensure_version_table(conn.cursor())
+        if args.command == 'status':
+            status(conn)
+            return 0
+        if args.command == 'explain':
+            explain(conn, args.source)
+            return 0
+        if args.command == 'verify':
+            return 0 if verify(conn) else 1
+        if args.explain:
+            print("==== 迁移前 ====")
+            explain(conn, args.source)
+        ok = apply(conn) and verify(conn)
+        if args.explain:
+            print("\n==== 迁移后 ====")
+            explain(conn, args.source)
+        return 0 if ok else 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import os
+from collections import namedtuple
+
+from flask import request, jsonify
+
+# 分页接口的列（输出列名 -> SQL 表达式）、FROM、固定条件与排序；
+# valid_filter 为 ?getValid=1 时追加的条件（没有则为 None）
+PagedList = namedtuple('PagedList', ['columns', 'from_clause', 'where', 'key', 'descending', 'valid_filter'])
+
+# main.py 的各分页路由与 migrate.py explain 共用，改列或条件只改这里
+PAGED_LISTS = {
+    'checkin_task': PagedList(
+        {'taskId': 't.taskId', 'taskName': 't.taskName', 'expireTime': 't.expireTime', 'name': 'u.name'},
+        "checkin_task t JOIN user u ON t.uid = u.uid", [], 'taskId', True, "t.expireTime >= %s"),
+    'collect_task': PagedList(
+        {'taskId': 't.taskId', 'taskName': 't.taskName', 'expireTime': 't.expireTime', 'taskType': 't.taskType',
+         'name': 'u.name'},
+        "collect_task t JOIN user u ON t.uid = u.uid", ["t.taskType=%s"], 'taskId', True, "t.expireTime >= %s"),
+    'checkin_record': PagedList(
+        {'recordId': 'r.recordId', 'uid': 'r.uid', 'longitude': 'r.longitude', 'latitude': 'r.latitude',
+         'time': 'r.time', 'note': 'r.note'},
+        "checkin_record r", ["r.taskId=%s"], 'recordId', False, None),
+    'collect_record': PagedList(
+        {'recordId': 'r.recordId', 'uid': 'r.uid', 'taskId': 'r.taskId', 'content': 'r.content', 'time': 'r.time'},
+        "collect_record r", ["r.taskId=%s"], 'recordId', False, None),
+}
+
+
+def page_size():
+    return int(os.getenv("page.size", 500))
+
+
+def max_page_size():
+    return int(os.getenv("page.max_size", 1000))
+
+
+def page_args(columns):
+    # ?limit=&after=&fields=，fields 只接受 columns 中的列名；
+    # amis CRUD 翻页时发送 page/perPage，没有 after 时按 page 换算偏移量
+    limit = request.args.get('limit', type=int) or request.args.get('perPage', type=int) or page_size()
+    limit = max(1, min(limit, max_page_size()))
+    after = request.args.get('after', type=int)
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    offset = (page - 1) * limit if after is None else 0
+    fields = [f for f in request.args.get('fields', '').split(',') if f in columns]
+    return limit, after, offset, fields or list(columns)
+
+
+def page_queries(columns, selected, from_clause, where, key, descending=False, keyset=False):
+    # 返回 (计数语句, 取一页的语句)；keyset 为真时取页语句多一个 key 列游标条件。
+    # migrate.py explain 也用它生成分页接口的语句
+    condition = " WHERE " + " AND ".join(where) if where else ""
+    count_query = f"SELECT COUNT(*) FROM {from_clause}{condition}"
+    if keyset:
+        where = list(where) + [f"{columns[key]} {'<' if descending else '>'} %s"]
+        condition = " WHERE " + " AND ".join(where)
+    select = ", ".join(f"{columns[f]} AS {f}" for f in selected)
+    query = (f"SELECT {select} FROM {from_clause}{condition}"
+             f" ORDER BY {columns[key]} {'DESC' if descending else 'ASC'} LIMIT %s OFFSET %s")
+    return count_query, query
+
+
+def query_page(cursor, columns, from_clause, where, params, key, descending=False, decorate=None, derived=None):
+    # 按 key 列做 keyset 分页，每次只取一页（多取一行判断是否还有下一页）。
+    # columns: 输出列名 -> SQL 表达式，必须包含 key；decorate(items) 可为本页条目补充字段；
+    # derived: 输出列名 -> (来源列名, 函数)，由来源列的值在内存中计算（例如按学号查姓名）
+    derived = derived or {}
+    limit, after, offset, fields = page_args({**columns, **derived})
+    if key not in fields:
+        fields = [key] + fields
+    selected = [f for f in fields if f in columns]
+    for f in fields:
+        if f in derived and derived[f][0] not in selected:
+            selected.append(derived[f][0])
+    params = list(params)
+    count_query, query = page_queries(columns, selected, from_clause, where, key, descending,
+                                      keyset=after is not None)
+
+    cursor.execute(count_query, tuple(params))
+    total = cursor.fetchone()[0]
+
+    if after is not None:
+        params.append(after)
+    cursor.execute(query, tuple(params) + (limit + 1, offset))
+    rows = cursor.fetchall()
+
+    has_more = len(rows) > limit
+    items = [dict(zip(selected, row)) for row in rows[:limit]]
+    for f in fields:
+        if f in derived:
+            source, compute = derived[f]
+            for item in items:
+                item[f] = compute(item[source])
+    if decorate is not None:
+        decorate(items)
+    data = {
+        'items': items,
+        # 总数只放在 X-Total-Count 头中：amis 看到 total 会改用按页码分页并显示页码。
+        # hasNext 让 amis 显示上一页/下一页
+        'hasNext': has_more,
+        'hasMore': has_more,
+        'nextAfter': items[-1][key] if has_more else None,
+    }
+    response = jsonify(data)
+    response.headers['X-Total-Count'] = str(total)
+    return response
@@ -0,0 +1,47 @@
+import mimetypes
+import os
+import re
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+# 上传文件名为内容哈希（或 uuid），内容不会变化，可长期缓存
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+_HASH_NAME = re.compile(r'^([0-9a-f]{32}|[0-9a-f]{64})\.')
+
+
+def accel_mode():
+    # 空：由 Python 发送；nginx：X-Accel-Redirect；sendfile：X-Sendfile（Apache/lighttpd）
+    return os.getenv("upload.accel", "")
+
+
+def _etag(path):
+    # 内容寻址的文件名本身就是强校验值；其余文件使用修改时间与大小
+    name = os.path.basename(path)
+    if _HASH_NAME.match(name):
+        return name
+    stat = os.stat(path)
+    return f"{int(stat.st_mtime)}-{stat.st_size}-{name}"
+
+
+def send_static(root, relative, accel_prefix=None):
+    # 发送 root 下的 relative 文件：强 ETag、条件请求、Range，以及可选的前端代理直接发送。
+    # accel_prefix 为 root 在 nginx 中对应的 internal location
+    path = safe_join(root, relative)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    etag = _etag(path)
+    mode = accel_mode()
+    if mode == 'nginx':
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            prefix = (accel_prefix or os.getenv("upload.accel_prefix", "/protected-upload")).rstrip('/')
+            response.headers['X-Accel-Redirect'] = f"{prefix}/{relative}"
+    else:
+        # sendfile 模式由 app.config['USE_X_SENDFILE'] 交给 send_file 处理
+        response = send_file(os.path.abspath(path), conditional=True, etag=etag, max_age=31536000)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
@@ -11,6 +11,10 @@ CREATE TABLE `checkin_task` (
   `taskName` VARCHAR(50),
   `expireTime` DATETIME,
   `uid` VARCHAR(20),
+  `summarized` TINYINT NOT NULL DEFAULT 0,
+  `centerLng` DOUBLE,
+  `centerLat` DOUBLE,
+  `radius` DOUBLE,
   FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
 );
 
@@ -22,6 +26,7 @@ CREATE TABLE `checkin_record` (
   `latitude` DOUBLE,
   `time` DATETIME,
   `note` VARCHAR(128),
+  UNIQUE KEY `uk_checkin_record_task_uid` (`taskId`, `uid`),
   FOREIGN KEY (`taskId`) REFERENCES `checkin_task`(`taskId`),
   FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
 );
@@ -32,6 +37,7 @@ CREATE TABLE `collect_task` (
   `taskType` VARCHAR(50),
   `expireTime` DATETIME,
   `uid` VARCHAR(20),
+  KEY `idx_collect_task_type_id` (`taskType`, `taskId`),
   FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
 );
 
@@ -41,6 +47,7 @@ CREATE TABLE `collect_record` (
   `uid` VARCHAR(20),
   `content` VARCHAR(1024),
   `time` DATETIME,
+  UNIQUE KEY `uk_collect_record_task_uid` (`taskId`, `uid`),
   FOREIGN KEY (`taskId`) REFERENCES `collect_task`(`taskId`),
   FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
 );
@@ -49,6 +56,7 @@ CREATE TABLE `user_role` (
   `uid` VARCHAR(20),
   `role` VARCHAR(20),
   `createdBy` VARCHAR(20),
+  KEY `idx_user_role_role` (`role`),
   FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
 );
 
@@ -56,6 +64,7 @@ CREATE TABLE `log` (
   `uid` VARCHAR(20),
   `info` VARCHAR(1024),
   `time` DATETIME,
+  KEY `idx_log_time` (`time`),
   FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
 );
 
@@ -64,3 +73,26 @@ CREATE TABLE bbs (
   content VARCHAR(1024) not null,
   time DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE TABLE `attendance_summary` (
+  `uid` VARCHAR(20) PRIMARY KEY,
+  `eligible` INT NOT NULL DEFAULT 0,
+  `checkedIn` INT NOT NULL DEFAULT 0,
+  `onLeave` INT NOT NULL DEFAULT 0,
+  `absent` INT NOT NULL DEFAULT 0,
+  `lastCheckin` DATETIME,
+  FOREIGN KEY (`uid`) REFERENCES `user`(`uid`)
+);
+
+CREATE TABLE `cache_generation` (
+  `name` VARCHAR(50) PRIMARY KEY,
+  `generation` BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE `lottery_draw` (
+  `id` INT AUTO_INCREMENT PRIMARY KEY,
+  `role` VARCHAR(20) NOT NULL,
+  `winners` TEXT NOT NULL,
+  `time` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  KEY `idx_lottery_draw_role_id` (`role`, `id`)
+);
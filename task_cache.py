@@ -0,0 +1,98 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+from flask import request, Response
+
+from db_pool import get_db
+
+
+class _Entry:
+
+    def __init__(self, body, headers, etag, expires_at, deadline, version):
+        self.body = body
+        self.headers = headers
+        self.etag = etag
+        # expires_at：列表中最早过期任务的 expireTime；deadline：兜底 TTL（单调时钟）
+        self.expires_at = expires_at
+        self.deadline = deadline
+        # version：生成时 cache_generation 中的共享版本号
+        self.version = version
+
+    def valid(self, version):
+        if version != self.version or time.monotonic() >= self.deadline:
+            return False
+        return self.expires_at is None or datetime.datetime.now() < self.expires_at
+
+
+class TaskListCache:
+    # 公开任务列表的进程内缓存：按接口与查询参数缓存响应，写操作时失效，
+    # getValid 列表在最早一个任务过期时自动失效；支持 ETag/If-None-Match。
+    # 多进程部署时写操作同时递增 cache_generation 表中的版本号，各 worker 每隔
+    # task_cache.version_interval 秒读取一次（主键查询），版本变化即丢弃缓存
+
+    def __init__(self, ttl=None, max_entries=None, version_interval=None):
+        self.ttl = ttl or float(os.getenv("task_cache.ttl", 60))
+        self.max_entries = max_entries or int(os.getenv("task_cache.max_entries", 256))
+        self.version_interval = version_interval or float(os.getenv("task_cache.version_interval", 1))
+        self._entries = {}
+        self._generations = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, endpoint, cursor):
+        # 在写操作的事务中调用（提交前），共享版本号与数据一起提交
+        cursor.execute("INSERT INTO cache_generation(name, generation) VALUES(%s, 1) "
+                       "ON DUPLICATE KEY UPDATE generation=generation+1", (endpoint,))
+        with self._lock:
+            self._generations[endpoint] = self._generations.get(endpoint, 0) + 1
+            self._versions.pop(endpoint, None)
+            for key in [k for k in self._entries if k[0] == endpoint]:
+                del self._entries[key]
+
+    def version(self, endpoint):
+        cached = self._versions.get(endpoint)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+        cursor = get_db().cursor()
+        cursor.execute("SELECT generation FROM cache_generation WHERE name=%s", (endpoint,))
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        self._versions[endpoint] = (version, time.monotonic() + self.version_interval)
+        return version
+
+    def serve(self, endpoint, build, valid_until=None):
+        # build() 生成响应；valid_until() 返回当前有效任务中最早的过期时间
+        key = (endpoint, tuple(sorted(request.args.items(multi=True))))
+        version = self.version(endpoint)
+        entry = self._entries.get(key)
+        if entry is None or not entry.valid(version):
+            with self._lock:
+                generation = self._generations.get(endpoint, 0)
+            # 先取过期时间再生成列表，期间过期的任务会让缓存立即失效而不是被漏掉
+            expires_at = valid_until() if valid_until and request.args.get('getValid') else None
+            response = build()
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = _Entry(body,
+                           [(k, v) for k, v in response.headers.items() if k.startswith('X-')],
+                           hashlib.sha1(body).hexdigest(),
+                           expires_at,
+                           time.monotonic() + self.ttl,
+                           version)
+            with self._lock:
+                # 生成期间发生了写操作则不缓存，避免存入旧数据
+                if self._generations.get(endpoint, 0) == generation:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_entries:
+                        del self._entries[next(iter(self._entries))]
+        response = Response(entry.body, mimetype='application/json', headers=entry.headers)
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+
+cache = TaskListCache()
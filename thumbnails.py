@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# Pillow 导入较慢，首次生成缩略图时再导入（子进程中同样按需导入）
+Image = None
+ImageOps = None
+
+# 尺寸名 -> 最长边像素
+SIZES = {
+    'thumb': 240,
+    'preview': 1280,
+}
+
+
+@lru_cache(maxsize=1)
+def _load_pil():
+    global Image, ImageOps
+    try:
+        from PIL import Image as _Image, ImageOps as _ImageOps
+    except ImportError:
+        return False
+    Image, ImageOps = _Image, _ImageOps
+    return True
+
+
+def _format():
+    if _load_pil() and 'WEBP' in Image.registered_extensions().values():
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def render(src, dst, max_side):
+    # 在子进程中执行：生成缩略图并原子地写入 dst
+    image_format, _ = _format()
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((max_side, max_side))
+        if im.mode not in ('RGB', 'RGBA') or (image_format == 'JPEG' and im.mode == 'RGBA'):
+            im = im.convert('RGB')
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+        try:
+            im.save(tmp, image_format, quality=80)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return dst
+
+
+class ThumbnailService:
+    # 上传/提交后在进程池中生成缩略图与预览图，缓存在 upload/.derived/<尺寸>/ 下；
+    # 请求时尚未生成则就地生成
+
+    def __init__(self, upload_root, workers=None, wait=None):
+        self.upload_root = upload_root
+        self.derived_root = os.path.join(upload_root, '.derived')
+        self.workers = workers or int(os.getenv("thumb.workers", 2))
+        self.wait = wait or float(os.getenv("thumb.wait", 5))
+        self._executor = None
+        self._pid = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return _load_pil()
+
+    def _get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    # 请求线程中创建进程池时其他线程可能持有锁，fork 出的子进程会死锁；
+                    # 使用 forkserver（不支持时用 spawn）从干净的进程启动 worker
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    self._pending = {}
+                    self._pid = pid
+        return self._executor
+
+    def source_path(self, relative):
+        return os.path.join(self.upload_root, relative)
+
+    def derived_path(self, relative, size):
+        return os.path.join(self.derived_root, size, f"{relative}.{_format()[1]}")
+
+    def schedule(self, relative):
+        if not self.available:
+            return
+        executor = self._get_executor()
+        for size, max_side in SIZES.items():
+            dst = self.derived_path(relative, size)
+            with self._lock:
+                if dst in self._pending or os.path.exists(dst):
+                    continue
+                future = executor.submit(render, self.source_path(relative), dst, max_side)
+                self._pending[dst] = future
+            future.add_done_callback(lambda _, key=dst: self._done(key))
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def get(self, relative, size):
+        # 返回派生图片路径；不支持该尺寸或无法生成时返回 None，由调用方返回原图
+        if not self.available or size not in SIZES:
+            return None
+        dst = self.derived_path(relative, size)
+        if os.path.exists(dst):
+            return dst
+        with self._lock:
+            future = self._pending.get(dst)
+        try:
+            if future is not None:
+                future.result(timeout=self.wait)
+            else:
+                render(self.source_path(relative), dst, SIZES[size])
+        except Exception:
+            return None
+        return dst if os.path.exists(dst) else None
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import uuid
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def detect_image_type(head):
+    # 根据文件头判断真实格式，返回扩展名；无法识别返回 None
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[:2] == b'BM':
+        return 'bmp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'heic'
+    return None
+
+
+def max_size():
+    return int(os.getenv("upload.max_size", 20 * 1024 * 1024))
+
+
+class UploadStore:
+    # 内容寻址存储：边写盘边计算 SHA-256，同一内容只存一份，路径为 ab/cd/<hash>.<ext>
+
+    def __init__(self, root, url_prefix='upload'):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.tmp_dir = os.path.join(root, '.tmp')
+
+    def relative_path(self, digest, ext):
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+    def save(self, stream, limit=None):
+        # 返回 (相对 upload/ 的路径, 是否为新文件)
+        limit = limit or max_size()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        ext = None
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if ext is None:
+                        ext = detect_image_type(chunk[:16])
+                        if ext is None:
+                            raise UploadError("不支持的文件类型")
+                    size += len(chunk)
+                    if size > limit:
+                        raise UploadError("文件过大")
+                    digest.update(chunk)
+                    f.write(chunk)
+            if ext is None:
+                raise UploadError("文件为空")
+            relative = self.relative_path(digest.hexdigest(), ext)
+            final_path = os.path.join(self.root, relative)
+            if os.path.exists(final_path):
+                return relative, False
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return relative, True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def url(self, relative):
+        return f"{self.url_prefix}/{relative}"
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from db_pool import connection
+
+UserInfo = namedtuple('UserInfo', ['uid', 'name', 'is_admin', 'tag', 'roles'])
+
+
+class UserDirectory:
+    # 在内存中维护 学号 -> 姓名、是否管理员、标签、用户组；按 TTL 或显式失效整体刷新。
+    # 名单一学期只变几次，查不到的学号单独查询一次并记住结果（包括不存在）
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or float(os.getenv("users.ttl", 600))
+        self._users = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT uid, role FROM user_role ORDER BY uid, role")
+            roles = {}
+            for uid, role in cursor.fetchall():
+                roles.setdefault(uid, []).append(role)
+            cursor.execute("SELECT uid, name, isAdmin, tag FROM user")
+            return {uid: UserInfo(uid, name, bool(is_admin), tag, tuple(roles.get(uid, ())))
+                    for uid, name, is_admin, tag in cursor.fetchall()}
+
+    def _load_one(self, uid):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT uid, name, isAdmin, tag FROM user WHERE uid=%s", (uid,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute("SELECT role FROM user_role WHERE uid=%s ORDER BY role", (uid,))
+            return UserInfo(row[0], row[1], bool(row[2]), row[3], tuple(r[0] for r in cursor.fetchall()))
+
+    def invalidate(self):
+        with self._lock:
+            self._users = None
+
+    def users(self):
+        users = self._users
+        if users is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return users
+        users = self._load()
+        with self._lock:
+            self._users = users
+            self._loaded_at = time.monotonic()
+        return users
+
+    def get(self, uid):
+        if uid is None:
+            return None
+        uid = str(uid)
+        users = self.users()
+        if uid in users:
+            return users[uid]
+        info = self._load_one(uid)
+        with self._lock:
+            users[uid] = info
+        return info
+
+    def name(self, uid):
+        info = self.get(uid)
+        return info.name if info is not None else None
+
+
+directory = UserDirectory()
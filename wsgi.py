@@ -0,0 +1,4 @@
+from main import create_app
+
+# 生产环境入口：gunicorn -c gunicorn.conf.py wsgi:app
+app = create_app()
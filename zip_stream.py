@@ -0,0 +1,102 @@
+import io
+import os
+import uuid
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+# 这些格式本身已压缩，打包时直接存储
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.heic', '.zip'}
+
+
+class _Sink(io.RawIOBase):
+    # 不可 seek 的输出，zipfile 会改用数据描述符写入；写入的字节随时被取走
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_date(time):
+    if time is None or time.year < 1980:
+        return 1980, 1, 1, 0, 0, 0
+    return time.year, time.month, time.day, time.hour, time.minute, time.second
+
+
+def generate(entries, base_dir=''):
+    # entries: (磁盘路径, 压缩包内文件名, 时间)；边读文件边产出 ZIP 字节，内存占用与任务大小无关
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for path, arcname, time in entries:
+            full_path = base_dir + path
+            if not os.path.isfile(full_path):
+                continue
+            zinfo = zipfile.ZipInfo(arcname, date_time=_zip_date(time))
+            if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.external_attr = 0o644 << 16
+            with open(full_path, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.pop()
+                    if data:
+                        yield data
+            yield sink.pop()
+    yield sink.pop()
+
+
+class ZipCache:
+    # 按任务与记录集版本缓存打包结果：首次下载边生成边写入磁盘，之后直接发送文件（支持 Range 续传）
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, task_id, version):
+        return os.path.join(self.cache_dir, f"{task_id}-{version}.zip")
+
+    def get(self, task_id, version):
+        path = self.path(task_id, version)
+        return path if os.path.isfile(path) else None
+
+    def _purge(self, task_id, keep):
+        prefix = f"{task_id}-"
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(prefix) and name.endswith('.zip') and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def tee(self, task_id, version, stream):
+        # 把 stream 的输出同时写入缓存；客户端中途断开则丢弃未完成的文件
+        os.makedirs(self.cache_dir, exist_ok=True)
+        final_path = self.path(task_id, version)
+        part_path = f"{final_path}.{uuid.uuid4().hex}.part"
+        complete = False
+        try:
+            with open(part_path, 'wb') as f:
+                for data in stream:
+                    f.write(data)
+                    yield data
+            os.replace(part_path, final_path)
+            complete = True
+            self._purge(task_id, final_path)
+        finally:
+            if not complete and os.path.exists(part_path):
+                os.remove(part_path)